@@ -0,0 +1,239 @@
+import json
+import posixpath
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import File
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from recipes.counters import change_counter
+from recipes.feed import push_recipe
+from recipes.images import schedule_renditions
+from recipes.matching import cookable_index
+from recipes.models import Ingredient, IngredientAmount, Recipe, RecipeTag, Tag
+from recipes.search import update_search_vectors
+from recipes.storage import recipe_image_storage
+
+from .cache import invalidate_on_commit
+from .serializers import RecipeCreateSerializer
+
+User = get_user_model()
+
+ARCHIVE_PREFIX = 'archive:'
+
+
+def collect_ids(items, field, key=None):
+    ids = set()
+    for item in items:
+        values = item.get(field)
+        if not isinstance(values, list):
+            continue
+        for value in values:
+            if key is not None:
+                value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(value, int):
+                ids.add(value)
+    return ids
+
+
+class RecipeImporter:
+    """Пакетный импорт рецептов из NDJSON.
+
+    Строки читаются пачками по batch_size: теги и ингредиенты пачки
+    загружаются двумя запросами, рецепты, теги и ингредиенты рецептов
+    вставляются через bulk_create. Картинка рецепта передаётся как
+    data:image;base64, как archive:<имя файла в zip-архиве> или как имя
+    уже сохранённого файла в хранилище (так её отдаёт экспорт).
+    """
+
+    def __init__(self, author, batch_size=100, archive=None):
+        self.author = author
+        self.batch_size = batch_size
+        self.archive = archive
+
+    def run(self, lines):
+        """Возвращает результаты по каждой непустой строке по мере импорта."""
+        batch = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            batch.append((number, line))
+            if len(batch) >= self.batch_size:
+                yield from self.import_batch(batch)
+                batch = []
+        if batch:
+            yield from self.import_batch(batch)
+
+    def import_batch(self, batch):
+        results = {}
+        items = self.parse(batch, results)
+        valid = self.validate(items, results)
+        try:
+            for number, recipe in self.save(valid):
+                results[number] = {
+                    'line': number, 'status': 'created', 'id': recipe.id}
+        except DatabaseError as error:
+            for number, _ in valid:
+                results[number] = self.error(number, str(error))
+        for number in sorted(results):
+            yield results[number]
+
+    def parse(self, batch, results):
+        items = []
+        for number, line in batch:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                results[number] = self.error(number, 'Некорректный JSON')
+                continue
+            if not isinstance(data, dict):
+                results[number] = self.error(number, 'Ожидается объект')
+                continue
+            items.append((number, data))
+        return items
+
+    def validate(self, items, results):
+        payloads = [data for _, data in items]
+        context = {'preloaded': {
+            Tag: Tag.objects.in_bulk(collect_ids(payloads, 'tags')),
+            Ingredient: Ingredient.objects.in_bulk(
+                collect_ids(payloads, 'ingredients', 'id')),
+        }}
+        valid = []
+        for number, data in items:
+            serializer, stored_image = self.get_serializer(data, context)
+            if not serializer.is_valid():
+                results[number] = self.error(number, serializer.errors)
+                continue
+            if stored_image is not None:
+                serializer.validated_data['image'] = stored_image
+            valid.append((number, serializer.validated_data))
+        return valid
+
+    def get_serializer(self, data, context):
+        image = data.get('image')
+        stored_image = None
+        if isinstance(image, str) and image.startswith(ARCHIVE_PREFIX):
+            data['image'] = self.archive_file(image[len(ARCHIVE_PREFIX):])
+        elif isinstance(image, str) and not image.startswith('data:'):
+            if self.is_stored_image(image):
+                stored_image = image
+                data.pop('image')
+        serializer = RecipeCreateSerializer(data=data, context=context)
+        if stored_image is not None:
+            serializer.fields['image'].required = False
+        return serializer, stored_image
+
+    @staticmethod
+    def is_stored_image(name):
+        upload_to = Recipe._meta.get_field('image').upload_to
+        if (not name.startswith(upload_to)
+                or posixpath.normpath(name) != name):
+            return False
+        try:
+            return recipe_image_storage.exists(name)
+        except SuspiciousFileOperation:
+            return False
+
+    def archive_file(self, member):
+        if self.archive is None or member not in self.archive.namelist():
+            return None
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        with self.archive.open(member) as source:
+            while True:
+                chunk = source.read(64 * 1024)
+                if not chunk:
+                    break
+                file.write(chunk)
+        file.seek(0)
+        return File(file, name=posixpath.basename(member))
+
+    def save(self, valid):
+        recipes = []
+        relations = []
+        for number, validated_data in valid:
+            data = dict(validated_data)
+            data.pop('author', None)
+            tags = data.pop('tags')
+            ingredients = data.pop('ingredients')
+            recipe = Recipe(author=self.author, **data)
+            recipes.append((number, recipe))
+            relations.append((recipe, tags, ingredients))
+        if not recipes:
+            return []
+        with transaction.atomic():
+            objects = [recipe for _, recipe in recipes]
+            if connection.features.can_return_ids_from_bulk_insert:
+                Recipe.objects.bulk_create(objects)
+                # bulk_create не отправляет post_save: обновляем счётчик,
+                # ленты подписчиков, поисковые индексы и запускаем
+                # обработку картинок сами.
+                change_counter(
+                    User, self.author.pk, 'recipes_count', len(objects))
+                for recipe in objects:
+                    name = recipe.image.name
+                    transaction.on_commit(
+                        lambda name=name: schedule_renditions(name))
+                    transaction.on_commit(
+                        lambda pk=recipe.pk: push_recipe(pk, self.author.pk))
+                ids = [recipe.pk for recipe in objects]
+                transaction.on_commit(lambda: update_search_vectors(ids))
+                transaction.on_commit(lambda: cookable_index.update(ids))
+            else:
+                for recipe in objects:
+                    recipe.save()
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag)
+                for recipe, tags, _ in relations for tag in tags)
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, ingredient=item['ingredient'],
+                    amount=item['amount'])
+                for recipe, _, ingredients in relations
+                for item in ingredients)
+            invalidate_on_commit('recipes')
+        return recipes
+
+    @staticmethod
+    def error(number, errors):
+        return {'line': number, 'status': 'error', 'errors': errors}
+
+
+def export_recipes(chunk_size=500):
+    """Отдаёт весь каталог построчно в NDJSON.
+
+    Рецепты читаются курсором через iterator(), теги и ингредиенты
+    подгружаются отдельными запросами на каждую пачку из chunk_size.
+    """
+    recipes = Recipe.objects.order_by('id').iterator(chunk_size=chunk_size)
+    chunk = []
+    for recipe in recipes:
+        chunk.append(recipe)
+        if len(chunk) >= chunk_size:
+            yield from export_chunk(chunk)
+            chunk = []
+    yield from export_chunk(chunk)
+
+
+def export_chunk(recipes):
+    prefetch_related_objects(
+        recipes, 'tags', Prefetch(
+            'ingredientamount', queryset=IngredientAmount.objects.only(
+                'recipe_id', 'ingredient_id', 'amount')))
+    for recipe in recipes:
+        yield json.dumps({
+            'id': recipe.id,
+            'author': recipe.author_id,
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'tags': [tag.id for tag in recipe.tags.all()],
+            'ingredients': [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in recipe.ingredientamount.all()
+            ],
+            'image': recipe.image.name,
+        }, ensure_ascii=False) + '\n'
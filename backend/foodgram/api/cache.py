@@ -0,0 +1,81 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def version_key(prefix):
+    return f'reference:{prefix}:version'
+
+
+def get_version(prefix):
+    """Текущее поколение кэша; меняется при каждой инвалидации."""
+    version = cache.get(version_key(prefix))
+    if version is None:
+        cache.add(version_key(prefix), time.time(), None)
+        version = cache.get(version_key(prefix), time.time())
+    return version
+
+
+def invalidate(prefix):
+    cache.set(version_key(prefix), time.time(), None)
+
+
+def invalidate_on_commit(prefix):
+    """Сбрасывает кэш после коммита, чтобы параллельный запрос не
+    закэшировал старые данные под новым поколением."""
+    transaction.on_commit(lambda: invalidate(prefix))
+
+
+def response_key(prefix, version, path):
+    digest = hashlib.md5(path.encode()).hexdigest()
+    return f'reference:{prefix}:{version}:{digest}'
+
+
+def lock_key(key):
+    return f'{key}:lock'
+
+
+def acquire(key):
+    """Берёт блокировку пересчёта ключа; удаётся только одному запросу."""
+    return cache.add(lock_key(key), 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT)
+
+
+def release(key):
+    cache.delete(lock_key(key))
+
+
+def wait_for(key):
+    """Ждёт, пока ключ посчитает запрос, взявший блокировку.
+
+    Возвращает None, если блокировка снята без результата или не
+    дождались за RESPONSE_CACHE_LOCK_TIMEOUT.
+    """
+    deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None or cache.get(lock_key(key)) is None:
+            return entry
+    return None
+
+
+def stats_key(prefix, name):
+    return f'reference:{prefix}:stats:{name}'
+
+
+def record(prefix, name):
+    key = stats_key(prefix, name)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, None)
+
+
+def get_stats(prefix):
+    names = ('hits', 'misses')
+    values = cache.get_many([stats_key(prefix, name) for name in names])
+    return {name: values.get(stats_key(prefix, name), 0) for name in names}
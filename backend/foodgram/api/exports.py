@@ -0,0 +1,84 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+SHOPPING_LIST_FIELDS = (
+    'ingredient__name', 'ingredient__measurement_unit', 'total_amount')
+
+
+class StreamRenderer(BaseRenderer):
+    """Рендерер для потоковых выгрузок.
+
+    Тело успешного ответа формирует сам view, рендерер нужен для выбора
+    формата и для ответов с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class TextStreamRenderer(StreamRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVStreamRenderer(StreamRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONStreamRenderer(StreamRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+
+class NDJSONStreamRenderer(StreamRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(items):
+    for item in items:
+        yield (f'{item["ingredient__name"]} '
+               f'({item["ingredient__measurement_unit"]}) - '
+               f'{item["total_amount"]}\n')
+
+
+def shopping_list_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for item in items:
+        yield writer.writerow(item[field] for field in SHOPPING_LIST_FIELDS)
+
+
+def shopping_list_json(items):
+    separator = '['
+    for item in items:
+        yield separator + '\n' + json.dumps({
+            'name': item['ingredient__name'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+            'amount': item['total_amount'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]\n' if separator == '[' else '\n]\n'
+
+
+SHOPPING_LIST_RENDERERS = (
+    TextStreamRenderer, CSVStreamRenderer, JSONStreamRenderer)
+
+SHOPPING_LIST_EXPORTS = {
+    'txt': shopping_list_txt,
+    'csv': shopping_list_csv,
+    'json': shopping_list_json,
+}
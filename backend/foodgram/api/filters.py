@@ -1,8 +1,15 @@
 from django_filters.rest_framework import FilterSet, filters
 from recipes.models import Recipe, Tag
+from recipes.search import search_recipes
 
 
 class RecipeFilter(FilterSet):
+    ORDERINGS = {
+        'popularity': ('-favorites_count', '-pub_date', '-id'),
+        'cooking_time': ('cooking_time', '-pub_date', '-id'),
+        'newest': ('-pub_date', '-id'),
+    }
+
     tags = filters.ModelMultipleChoiceFilter(
         queryset=Tag.objects.all(), field_name='tags__slug',
         to_field_name='slug')
@@ -10,6 +17,9 @@ class RecipeFilter(FilterSet):
         method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(key, key) for key in ORDERINGS], method='get_ordering')
 
     class Meta:
         model = Recipe
@@ -26,3 +36,9 @@ class RecipeFilter(FilterSet):
         if value:
             return queryset.filter(recipe_carts__user=user)
         return queryset
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*self.ORDERINGS[value])
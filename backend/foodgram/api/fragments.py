@@ -0,0 +1,116 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BooleanField, Prefetch, Value
+from recipes.models import Cart, Favorite, IngredientAmount, Recipe, Tag
+from users.models import Subscription
+
+from .cache import get_version
+from .serializers import RecipeSerializer
+
+BODIES_PREFIX = 'recipe-bodies'
+
+
+def recipe_version_key(pk):
+    return f'fragment:recipe:{pk}:version'
+
+
+def body_key(version, base, pk, recipe_version):
+    return f'fragment:{version}:{base}:{pk}:{recipe_version}'
+
+
+def overlay_key(user_id):
+    return f'fragment:overlay:{user_id}'
+
+
+def bump_recipes(recipe_ids):
+    """Новая версия тел рецептов; старые фрагменты истекут по TTL."""
+    now = time.time()
+    transaction.on_commit(lambda: cache.set_many(
+        {recipe_version_key(pk): now for pk in recipe_ids}, None))
+
+
+def invalidate_overlay(user_id):
+    transaction.on_commit(lambda: cache.delete(overlay_key(user_id)))
+
+
+def get_overlay(user):
+    """id избранного, корзины и подписок пользователя."""
+    overlay = cache.get(overlay_key(user.pk))
+    if overlay is None:
+        overlay = (
+            set(Favorite.objects.filter(user=user).values_list(
+                'recipe_id', flat=True)),
+            set(Cart.objects.filter(user=user).values_list(
+                'recipe_id', flat=True)),
+            set(Subscription.objects.filter(user=user).values_list(
+                'author_id', flat=True)),
+        )
+        cache.set(overlay_key(user.pk), overlay,
+                  settings.RECIPE_FRAGMENT_TIMEOUT)
+    return overlay
+
+
+def shared_queryset():
+    """Рецепты без данных о текущем пользователе."""
+    return Recipe.objects.select_related('author').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.all()),
+        Prefetch('ingredientamount',
+                 queryset=IngredientAmount.objects.select_related(
+                     'ingredient')),
+        Prefetch('author__subscribers', queryset=Subscription.objects.none(),
+                 to_attr='request_user_subscriptions'),
+    ).annotate(
+        is_favorited=Value(False, output_field=BooleanField()),
+        is_in_shopping_cart=Value(False, output_field=BooleanField()),
+    )
+
+
+def renditions_ready(body):
+    """Копии картинки созданы и в теле нет ссылок-заглушек на оригинал."""
+    return not body['images'] or body['image'] not in body['images'].values()
+
+
+def get_bodies(ids, request):
+    """Общие для всех пользователей тела рецептов, из кэша или базы."""
+    base = hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()
+    version = get_version(BODIES_PREFIX)
+    versions = cache.get_many([recipe_version_key(pk) for pk in ids])
+    keys = {
+        pk: body_key(version, base, pk,
+                     versions.get(recipe_version_key(pk), 0))
+        for pk in ids
+    }
+    cached = cache.get_many(keys.values())
+    bodies = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in ids if pk not in bodies]
+    if missing:
+        recipes = shared_queryset().filter(pk__in=missing)
+        data = RecipeSerializer(
+            recipes, many=True, context={'request': request}).data
+        fresh = {body['id']: body for body in data}
+        cache.set_many({keys[pk]: body for pk, body in fresh.items()
+                        if renditions_ready(body)},
+                       settings.RECIPE_FRAGMENT_TIMEOUT)
+        bodies.update(fresh)
+    return bodies
+
+
+def render_recipes(ids, request):
+    """Тела рецептов с наложенными полями текущего пользователя."""
+    bodies = get_bodies(ids, request)
+    favorites, carts, subscriptions = get_overlay(request.user)
+    result = []
+    for pk in ids:
+        if pk not in bodies:
+            continue
+        body = bodies[pk]
+        body['is_favorited'] = pk in favorites
+        body['is_in_shopping_cart'] = pk in carts
+        body['author']['is_subscribed'] = (
+            body['author']['id'] in subscriptions)
+        result.append(body)
+    return result
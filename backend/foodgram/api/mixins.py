@@ -1,3 +1,14 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from .cache import (acquire, get_version, record, release, response_key,
+                    wait_for)
 
 
 class GetSerializerClassMixin:
@@ -9,3 +20,58 @@ class GetSerializerClassMixin:
             return self.serializer_class_by_action[self.action]
         except KeyError:
             return super().get_serializer_class()
+
+
+class ReferenceCacheMixin:
+    """Mixin caching rendered JSON of list/retrieve with ETag support"""
+    cache_prefix = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def should_cache(self, request):
+        return True
+
+    def get_cache_path(self, request):
+        return request.get_full_path()
+
+    def get_cache_timeout(self):
+        return settings.REFERENCE_CACHE_TIMEOUT
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.should_cache(request):
+            return handler(request, *args, **kwargs)
+        version = get_version(self.cache_prefix)
+        key = response_key(
+            self.cache_prefix, version, self.get_cache_path(request))
+        entry = cache.get(key)
+        locked = entry is None and acquire(key)
+        if entry is None and not locked:
+            entry = wait_for(key)
+        hit = entry is not None
+        if not hit:
+            try:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                content = JSONRenderer().render(response.data)
+                entry = (f'"{hashlib.md5(content).hexdigest()}"', content)
+                cache.set(key, entry, self.get_cache_timeout())
+            finally:
+                if locked:
+                    release(key)
+        record(self.cache_prefix, 'hits' if hit else 'misses')
+        etag, content = entry
+        last_modified = int(version)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
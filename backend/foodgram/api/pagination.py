@@ -0,0 +1,248 @@
+import base64
+import binascii
+import datetime
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import (EmptyPage, Page, PageNotAnInteger,
+                                   Paginator)
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Кодирует даты с микросекундами, в отличие от DjangoJSONEncoder.
+
+    Иначе строки из одной миллисекунды на границе страницы пропускаются.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL.
+
+    На других СУБД возвращает точное значение.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class ApproximatePage(Page):
+    """Страница, наличие следующей у которой известно по выборке."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator, не считающий COUNT(*) для больших выборок.
+
+    Пока выборка меньше PAGINATION_EXACT_COUNT_THRESHOLD, число строк
+    считается точно. Для больших выборок берётся оценка планировщика
+    PostgreSQL либо, при PAGINATION_COUNT_STRATEGY = 'cache', точное
+    значение, закэшированное на PAGINATION_COUNT_CACHE_TTL секунд.
+
+    Приблизительным бывает только count: номер страницы с ним не
+    сверяется, а наличие следующей страницы определяется выборкой
+    на одну строку больше.
+    """
+    count_is_approximate = False
+
+    def validate_number(self, number):
+        # count считается первым: от него зависит count_is_approximate.
+        if not self.count or not self.count_is_approximate:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        return ApproximatePage(rows[:self.per_page], number, self,
+                               has_next=len(rows) > self.per_page)
+
+    @cached_property
+    def count(self):
+        threshold = settings.PAGINATION_EXACT_COUNT_THRESHOLD
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        if settings.PAGINATION_COUNT_STRATEGY == 'cache':
+            return self.cached_count(threshold)
+        if connection.vendor != 'postgresql':
+            return super().count
+        estimate = estimate_count(self.object_list)
+        if estimate < threshold:
+            return super().count
+        self.count_is_approximate = True
+        return estimate
+
+    def cached_count(self, threshold):
+        sql, params = self.object_list.query.sql_with_params()
+        digest = hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+        key = f'pagination:count:{digest}'
+        count = cache.get(key)
+        if count is not None:
+            self.count_is_approximate = True
+            return count
+        count = super().count
+        if count >= threshold:
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+        return count
+
+
+class FeedPagination(PageNumberPagination):
+    """Пагинация по номеру страницы с необязательным режимом курсора.
+
+    Клиенты с page и limit работают как раньше. С параметром cursor
+    (пустым для первой страницы) страницы выбираются по ключу сортировки
+    (keyset) без OFFSET и без COUNT(*); общее число строк добавляется
+    только по запросу: count=exact или count=estimate.
+
+    Признак count_is_approximate показывает, что count посчитан по
+    оценке; ссылки next и previous при этом точные
+    (см. ApproximateCountPaginator).
+    """
+    django_paginator_class = ApproximateCountPaginator
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (
+            self.cursor_query_param in request.query_params
+            and hasattr(queryset, 'query'))
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+        self.total = self.get_total(queryset, request)
+        values = self.decode_cursor(request, queryset.model, ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, values))
+        rows = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(rows) > page_size:
+            self.next_cursor = self.encode_cursor(
+                ordering, rows[page_size - 1])
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return Response(OrderedDict([
+                ('count', self.page.paginator.count),
+                ('count_is_approximate',
+                 self.page.paginator.count_is_approximate),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ]))
+        response = OrderedDict()
+        if self.total is not None:
+            response['count'] = self.total
+        response['next'] = self.get_next_link()
+        response['previous'] = None
+        response['results'] = data
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, self.next_cursor)
+
+    def get_total(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    @staticmethod
+    def get_ordering(queryset):
+        ordering = list(
+            queryset.query.order_by or queryset.model._meta.ordering)
+        names = {field.name for field in queryset.model._meta.concrete_fields}
+        for field in ordering:
+            if (not isinstance(field, str)
+                    or field.lstrip('-') not in names | {'pk'}):
+                raise ValidationError(
+                    'Курсорная пагинация недоступна для этой сортировки')
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            descending = ordering and ordering[0].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    @staticmethod
+    def keyset_filter(ordering, values):
+        condition = equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    @staticmethod
+    def encode_cursor(ordering, row):
+        values = [getattr(row, field.lstrip('-')) for field in ordering]
+        data = json.dumps(values, cls=CursorEncoder).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, request, model, ordering):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            fields = [model._meta.pk if field.lstrip('-') == 'pk'
+                      else model._meta.get_field(field.lstrip('-'))
+                      for field in ordering]
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [field.to_python(value)
+                    for field, value in zip(fields, values)]
+        except (ValueError, binascii.Error, TypeError):
+            raise ValidationError({self.cursor_query_param: 'Неверный курсор'})
@@ -1,16 +1,27 @@
 import base64
+import binascii
 import logging
+import re
+import tempfile
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from django.core.files.base import File
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser.serializers import UserSerializer
-from recipes.models import Ingredient, IngredientAmount, Recipe, RecipeTag, Tag
+from PIL import ImageFile
+from recipes.images import rendition_urls
+from recipes.models import (Ingredient, IngredientAmount, Recipe, RecipeTag,
+                            ShoppingListItem, Tag)
 from rest_framework import serializers
 
 User = get_user_model()
 
 logger = logging.getLogger()
 
+NOT_BASE64 = re.compile(r'[^A-Za-z0-9+/=]')
+
 
 class CustomUserSerializer(UserSerializer):
     """Сериализатор модели User."""
@@ -22,7 +33,11 @@ class CustomUserSerializer(UserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request_user = self.context.get('request').user.id
+        if hasattr(obj, 'request_user_subscriptions'):
+            return bool(obj.request_user_subscriptions)
+        request_user = self.context.get('request').user
+        if not request_user.is_authenticated:
+            return False
         return obj.subscribers.filter(user=request_user).exists()
 
 
@@ -54,15 +69,76 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 
 class Base64ImageField(serializers.ImageField):
     """Сериализатор фото."""
+    chunk_size = 64 * 1024
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = File(self.decode(imgstr), name='temp.' + ext)
 
         return super().to_internal_value(data)
 
+    def decode(self, imgstr):
+        """Декодирует base64 по частям во временный файл.
+
+        Размер файла проверяется до декодирования, размеры картинки -
+        по заголовку, как только он прочитан.
+        """
+        if len(imgstr) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError('Слишком большой файл')
+        parser = ImageFile.Parser()
+        file = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        for chunk in self.iter_chunks(imgstr):
+            if parser is not None:
+                parser.feed(chunk)
+                if parser.image is not None:
+                    self.validate_dimensions(parser.image.size)
+                    parser = None
+            file.write(chunk)
+        file.seek(0)
+        return file
+
+    def iter_chunks(self, imgstr):
+        """Декодированные части base64; символы вне алфавита, как и
+        b64decode, пропускаются, остаток до кратного 4 переносится."""
+        tail = ''
+        for start in range(0, len(imgstr), self.chunk_size):
+            part = tail + NOT_BASE64.sub(
+                '', imgstr[start:start + self.chunk_size])
+            end = len(part) - len(part) % 4
+            part, tail = part[:end], part[end:]
+            yield self.b64decode(part)
+        if tail:
+            yield self.b64decode(tail)
+
+    @staticmethod
+    def b64decode(part):
+        try:
+            return base64.b64decode(part)
+        except binascii.Error:
+            raise serializers.ValidationError('Некорректный base64')
+
+    def validate_dimensions(self, size):
+        if max(size) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+            raise serializers.ValidationError(
+                'Слишком большое разрешение картинки')
+
+
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии фото."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get('request')
+        urls = rendition_urls(value)
+        if request is not None:
+            return {key: request.build_absolute_uri(url)
+                    for key, url in urls.items()}
+        return urls
+
 
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор тегов."""
@@ -95,19 +171,49 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class BulkPrimaryKeyRelatedField(serializers.ListField):
+    """Список id объектов, которые загружаются одним запросом in_bulk.
+
+    Уже загруженные объекты можно передать в context['preloaded']
+    в виде {модель: {id: объект}}.
+    """
+    child = serializers.IntegerField()
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        ids = super().to_internal_value(data)
+        objects = self.context.get('preloaded', {}).get(self.queryset.model)
+        if objects is None:
+            objects = self.queryset.in_bulk(set(ids))
+        missing = [pk for pk in ids if pk not in objects]
+        if missing:
+            raise serializers.ValidationError(
+                f'Недопустимые id: {missing}. Объекты не существуют.')
+        return [objects[pk] for pk in dict.fromkeys(ids)]
+
+    def to_representation(self, value):
+        return [obj.pk for obj in value.all()]
+
+
 class IngredientAmountCreateSerializer(serializers.ModelSerializer):
     """Сериализатор создания Ингредиент."""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-        source='ingredient',
-        write_only=True
-    )
+    id = serializers.IntegerField(write_only=True)
     amount = serializers.IntegerField()
 
     class Meta:
         model = IngredientAmount
         fields = ('id', 'amount')
 
+    def validate_amount(self, value):
+        if not (0 < value < 10000):
+            raise serializers.ValidationError(
+                'Недопустимое значение кол-ва ингредиентов. '
+                'Введите разумное значение')
+        return value
+
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор рецептов."""
@@ -119,6 +225,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         source='ingredientamount',
     )
     image = Base64ImageField()
+    images = ImageRenditionsField(source='image')
     author = CustomUserSerializer()
 
     class Meta:
@@ -126,70 +233,112 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'name', 'text', 'cooking_time', 'is_favorited',
-            'is_in_shopping_cart', 'image')
+            'is_in_shopping_cart', 'image', 'images')
         read_only_fields = ('id', 'author')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if self.context.get('request').user.is_authenticated:
             return obj.favorites.filter(
                 user=self.context['request'].user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if self.context.get('request').user.is_authenticated:
             return obj.recipe_carts.filter(
                 user=self.context['request'].user).exists()
         return False
 
     def create_ingredients(self, ingredients_data, recipe):
-        ingredient_amounts = []
-        for ingredient_data in ingredients_data:
-            if not (0 < ingredient_data['amount'] < 10000):
-                raise serializers.ValidationError(
-                    'Недопустимое значение кол-ва ингредиентов. '
-                    'Введите разумное значение')
-            ingredient_amounts.append(IngredientAmount(
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
                 recipe=recipe, ingredient=ingredient_data['ingredient'],
-                amount=ingredient_data['amount']
-            ))
-
-        IngredientAmount.objects.bulk_create(ingredient_amounts)
+                amount=ingredient_data['amount'])
+            for ingredient_data in ingredients_data)
 
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
-        for tag in tags_data:
-            RecipeTag.objects.create(recipe=recipe, tag=tag)
-        self.create_ingredients(
-            ingredients_data=ingredients_data, recipe=recipe)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag) for tag in tags_data)
+            self.create_ingredients(
+                ingredients_data=ingredients_data, recipe=recipe)
         return recipe
 
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
         tags_data = validated_data.pop('tags', None)
-        for key, value in validated_data.items():
-            setattr(instance, key, value)
-        instance.save()
-        if tags_data is not None:
-            instance.tags.set(tags_data)
-        if ingredients_data is not None:
-            IngredientAmount.objects.filter(recipe=instance).delete()
-            self.create_ingredients(
-                ingredients_data=ingredients_data, recipe=instance)
+        with transaction.atomic():
+            for key, value in validated_data.items():
+                setattr(instance, key, value)
+            instance.save()
+            if tags_data is not None:
+                instance.tags.set(tags_data)
+            if ingredients_data is not None:
+                self.update_ingredients(ingredients_data, instance)
         return instance
 
+    def update_ingredients(self, ingredients_data, recipe):
+        """Приводит ингредиенты рецепта к новому набору, меняя только
+        отличающиеся строки. Данные уже проверены в validate_ingredients."""
+        wanted = {
+            ingredient_data['ingredient'].id: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+        deltas = dict(wanted)
+        changed, removed = [], []
+        for row in IngredientAmount.objects.filter(recipe=recipe):
+            deltas[row.ingredient_id] = (
+                deltas.get(row.ingredient_id, 0) - row.amount)
+            amount = wanted.pop(row.ingredient_id, None)
+            if amount is None:
+                removed.append(row.id)
+            elif amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if removed:
+            IngredientAmount.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+        if wanted:
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, ingredient_id=ingredient_id,
+                    amount=amount)
+                for ingredient_id, amount in wanted.items())
+        ShoppingListItem.objects.change_amounts(recipe, deltas)
+
     def to_representation(self, instance):
+        prefetch_related_objects([instance], Prefetch(
+            'ingredientamount',
+            queryset=IngredientAmount.objects.select_related('ingredient')))
         ret = super().to_representation(instance)
         ret['ingredients'] = IngredientAmountSerializer(
             instance.ingredientamount.all(), many=True).data
         return ret
 
 
+class CookableRecipeSerializer(RecipeSerializer):
+    """Рецепт с ингредиентами, которых не хватает пользователю."""
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('missing_ingredients',)
+
+    def get_missing_ingredients(self, obj):
+        available = self.context['available']
+        return [item.ingredient_id for item in obj.ingredientamount.all()
+                if item.ingredient_id not in available]
+
+
 class RecipeCreateSerializer(RecipeSerializer):
     ingredients = IngredientAmountCreateSerializer(many=True, write_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True, queryset=Tag.objects.all())
+    tags = BulkPrimaryKeyRelatedField(queryset=Tag.objects.all())
     author = serializers.CharField(required=False)
 
     class Meta:
@@ -199,11 +348,38 @@ class RecipeCreateSerializer(RecipeSerializer):
             'name', 'text', 'cooking_time', 'is_favorited',
             'is_in_shopping_cart', 'image')
 
+    def validate_ingredients(self, value):
+        ids = [item['id'] for item in value]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты в рецепте не должны повторяться.')
+        ingredients = self.context.get('preloaded', {}).get(Ingredient)
+        if ingredients is None:
+            ingredients = Ingredient.objects.in_bulk(
+                {item['id'] for item in value})
+        missing = [item['id'] for item in value
+                   if item['id'] not in ingredients]
+        if missing:
+            raise serializers.ValidationError(
+                f'Недопустимые id ингредиентов: {missing}.')
+        return [
+            {'ingredient': ingredients[item['id']], 'amount': item['amount']}
+            for item in value
+        ]
+
 
 class RecipeSubscSerializer(serializers.ModelSerializer):
     """Сокращённый сериализатор для рецептов."""
     image = Base64ImageField()
+    images = ImageRenditionsField(source='image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image')
+        fields = ('id', 'name', 'cooking_time', 'image', 'images')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1, max_length=100)
@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.managers import relations_added, relations_removed
+from recipes.models import (Cart, Favorite, Ingredient, IngredientAmount,
+                            Recipe, RecipeTag, Tag)
+from users.models import Subscription
+
+from .cache import invalidate_on_commit
+from .fragments import BODIES_PREFIX, bump_recipes, invalidate_overlay
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    invalidate_on_commit('tags')
+    invalidate_on_commit('recipes')
+    invalidate_on_commit(BODIES_PREFIX)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    invalidate_on_commit('ingredients')
+    invalidate_on_commit('recipes')
+    invalidate_on_commit(BODIES_PREFIX)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def invalidate_recipes(sender, **kwargs):
+    invalidate_on_commit('recipes')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe(sender, instance, **kwargs):
+    bump_recipes([instance.pk])
+
+
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def bump_recipe_relation(sender, instance, **kwargs):
+    bump_recipes([instance.recipe_id])
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes(sender, instance, created, update_fields=None,
+                        **kwargs):
+    if created or update_fields and set(update_fields) <= {
+            'last_login', 'password'}:
+        return
+    bump_recipes(list(instance.recipes.values_list('pk', flat=True)))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_user_overlay(sender, instance, **kwargs):
+    invalidate_overlay(instance.user_id)
+
+
+@receiver(relations_added, sender=Favorite)
+@receiver(relations_removed, sender=Favorite)
+@receiver(relations_added, sender=Cart)
+@receiver(relations_removed, sender=Cart)
+@receiver(relations_added, sender=Subscription)
+@receiver(relations_removed, sender=Subscription)
+def invalidate_user_overlay_batch(sender, user_id, **kwargs):
+    invalidate_overlay(user_id)
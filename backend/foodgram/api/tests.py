@@ -0,0 +1,408 @@
+import base64
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from recipes.counters import reconcile_counters
+from recipes.images import rendition_name
+from recipes.models import (Cart, Favorite, Ingredient, IngredientAmount,
+                            Recipe, RecipeTag, ShoppingListItem, Tag)
+from recipes.storage import recipe_image_storage
+from rest_framework.test import APIClient
+
+from users.models import Subscription
+
+from .filters import RecipeFilter
+from .serializers import Base64ImageField
+
+User = get_user_model()
+
+
+class RecipeDataMixin:
+    """Пользователь, теги, ингредиенты и рецепты для тестов API."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='Pass12345',
+            first_name='Иван', last_name='Петров')
+        self.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(2)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        self.anon = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipes(self, count):
+        recipes = [
+            Recipe.objects.create(
+                author=self.user, name=f'Рецепт {i}', text='Текст',
+                cooking_time=10, image='recipes/test.png')
+            for i in range(count)
+        ]
+        for recipe in recipes:
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag) for tag in self.tags)
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(recipe=recipe, ingredient=ingredient,
+                                 amount=5)
+                for ingredient in self.ingredients)
+        return recipes
+
+
+class RecipeListQueryTests(RecipeDataMixin, TestCase):
+
+    def assert_list_queries(self, client, count):
+        self.create_recipes(8)
+        for limit in (2, 6):
+            cache.clear()
+            with self.assertNumQueries(count):
+                response = client.get('/api/recipes/', {'limit': limit})
+            self.assertEqual(len(response.json()['results']), limit)
+
+    def test_anonymous_list_does_not_depend_on_page_size(self):
+        self.assert_list_queries(self.anon, 6)
+
+    def test_authenticated_list_does_not_depend_on_page_size(self):
+        self.assert_list_queries(self.client, 10)
+
+    @skipUnless(connection.vendor == 'sqlite', 'план запроса SQLite')
+    def test_orderings_are_served_by_indexes(self):
+        for ordering in RecipeFilter.ORDERINGS.values():
+            plan = Recipe.objects.order_by(*ordering)[:10].explain()
+            self.assertNotIn('TEMP B-TREE', plan, ordering)
+
+
+class RecipeUpdateTests(RecipeDataMixin, TestCase):
+
+    def test_ingredient_update_writes_only_changed_rows(self):
+        ingredients = self.ingredients + [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3, 9)
+        ]
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Текст', cooking_time=10,
+            image='recipes/test.png')
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in ingredients[:8])
+        payload = [{'id': ingredient.pk, 'amount': 5}
+                   for ingredient in ingredients[1:9]]
+        payload[0]['amount'] = 7
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                {'ingredients': payload, 'tags': [self.tags[0].pk]},
+                format='json')
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            query['sql'].split()[0] for query in context.captured_queries
+            if '"recipes_ingredientamount"' in query['sql']
+            and not query['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(sorted(writes), ['DELETE', 'INSERT', 'UPDATE'])
+        self.assertEqual(
+            dict(recipe.ingredientamount.values_list('ingredient', 'amount')),
+            {item['id']: item['amount'] for item in payload})
+
+    def test_repeated_ingredients_are_rejected(self):
+        recipe, = self.create_recipes(1)
+        ingredient = self.ingredients[0]
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/',
+            {'ingredients': [{'id': ingredient.pk, 'amount': 9000}] * 4},
+            format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.json())
+        self.assertEqual(
+            recipe.ingredientamount.get(ingredient=ingredient).amount, 5)
+
+
+class CursorPaginationTests(RecipeDataMixin, TestCase):
+
+    def test_cursor_walks_rows_from_the_same_millisecond(self):
+        recipes = self.create_recipes(6)
+        start = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+        for number, recipe in enumerate(recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=start + datetime.timedelta(microseconds=10 * number))
+        expected = [recipe.pk for recipe in reversed(recipes)]
+
+        seen = []
+        params = {'cursor': '', 'limit': 2}
+        while True:
+            response = self.anon.get('/api/recipes/', params)
+            self.assertEqual(response.status_code, 200)
+            seen += [recipe['id'] for recipe in response.json()['results']]
+            next_link = response.json()['next']
+            if next_link is None:
+                break
+            params = {key: values[0] for key, values in
+                      parse_qs(urlparse(next_link).query).items()}
+        self.assertEqual(seen, expected)
+
+
+@override_settings(PAGINATION_COUNT_STRATEGY='cache',
+                   PAGINATION_EXACT_COUNT_THRESHOLD=1)
+class ApproximateCountTests(RecipeDataMixin, TestCase):
+
+    def walk(self, limit):
+        seen = []
+        params = {'limit': limit}
+        while True:
+            response = self.client.get('/api/recipes/', params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            seen += [recipe['id'] for recipe in data['results']]
+            if data['next'] is None:
+                return seen, data
+            params = {key: values[0] for key, values in
+                      parse_qs(urlparse(data['next']).query).items()}
+
+    def test_pages_past_a_low_count_are_reachable(self):
+        self.create_recipes(3)
+        self.walk(2)
+        recipes = self.create_recipes(4)
+        seen, data = self.walk(2)
+        self.assertTrue(data['count_is_approximate'])
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(len(seen), 7)
+        self.assertIn(recipes[0].pk, seen)
+
+    def test_no_next_link_past_the_last_row(self):
+        recipes = self.create_recipes(4)
+        self.walk(2)
+        Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes[:2]]
+                              ).delete()
+        seen, data = self.walk(2)
+        self.assertEqual(len(seen), 2)
+        self.assertIsNone(data['next'])
+
+
+class RecipeImportTests(RecipeDataMixin, TestCase):
+
+    def test_unsafe_image_path_is_a_line_error(self):
+        line = json.dumps({
+            'name': 'Рецепт', 'text': 'Текст', 'cooking_time': 10,
+            'tags': [self.tags[0].pk],
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 5}],
+            'image': '../../etc/passwd',
+        })
+        response = self.client.post(
+            '/api/recipes/bulk/', line, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['failed'], 1)
+        result = response.json()['results'][0]
+        self.assertEqual(result['status'], 'error')
+        self.assertIn('image', result['errors'])
+
+
+class RecipeFragmentTests(RecipeDataMixin, TestCase):
+
+    def test_fallback_images_are_not_cached(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            recipe, = self.create_recipes(1)
+            response = self.client.get('/api/recipes/')
+            images = response.json()['results'][0]['images']
+            self.assertEqual(set(images.values()),
+                             {response.json()['results'][0]['image']})
+
+            for rendition in settings.RECIPE_IMAGE_RENDITIONS:
+                path = recipe_image_storage.path(
+                    rendition_name(recipe.image.name, rendition))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'wb').close()
+            response = self.client.get('/api/recipes/')
+            images = response.json()['results'][0]['images']
+            for rendition, url in images.items():
+                self.assertTrue(url.endswith(
+                    rendition_name(recipe.image.name, rendition)))
+
+
+class Base64ImageFieldTests(TestCase):
+
+    @mock.patch.object(Base64ImageField, 'chunk_size', 100)
+    def test_wrapped_base64_is_decoded_across_chunks(self):
+        buffer = io.BytesIO()
+        Image.effect_noise((40, 40), 64).save(buffer, 'PNG')
+        content = buffer.getvalue()
+        imgstr = base64.encodebytes(content).decode()
+        self.assertIn('\n', imgstr[:100])
+        self.assertEqual(Base64ImageField().decode(imgstr).read(), content)
+
+
+class RelationDataMixin(RecipeDataMixin):
+    """Данные для проверок избранного, корзины и подписок.
+
+    TransactionTestCase нужен, чтобы выполнялись обработчики on_commit,
+    сбрасывающие кэш полей пользователя.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('recipes.signals.schedule_renditions')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.other = User.objects.create_user(
+            username='guest', email='guest@example.com', password='Pass12345',
+            first_name='Пётр', last_name='Иванов')
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.other)
+
+    def assert_denormalized_data_is_consistent(self):
+        self.assertEqual(set(reconcile_counters(fix=False).values()), {0})
+        expected = {
+            (item['recipe__recipe_carts__user'], item['ingredient'],
+             item['total_amount'])
+            for item in ShoppingListItem.objects.expected()
+        }
+        self.assertEqual(set(ShoppingListItem.objects.values_list(
+            'user', 'ingredient', 'total_amount')), expected)
+
+    def assert_overlay_is_fresh(self):
+        favorites = set(Favorite.objects.filter(user=self.user).values_list(
+            'recipe', flat=True))
+        carts = set(Cart.objects.filter(user=self.user).values_list(
+            'recipe', flat=True))
+        subscriptions = set(Subscription.objects.filter(
+            user=self.user).values_list('author', flat=True))
+        response = self.client.get('/api/recipes/', {'limit': 100})
+        for recipe in response.json()['results']:
+            self.assertEqual(recipe['is_favorited'],
+                             recipe['id'] in favorites)
+            self.assertEqual(recipe['is_in_shopping_cart'],
+                             recipe['id'] in carts)
+            self.assertEqual(recipe['author']['is_subscribed'],
+                             recipe['author']['id'] in subscriptions)
+
+
+class RelationToggleTests(RelationDataMixin, TransactionTestCase):
+
+    def test_repeated_post_and_missing_delete(self):
+        recipe, = self.create_recipes(1)
+        for action in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{recipe.pk}/{action}/'
+            self.assertEqual(self.client.post(url).status_code, 201)
+            self.assertEqual(self.client.post(url).status_code, 400)
+            self.assertEqual(self.client.delete(url).status_code, 204)
+            self.assertEqual(self.client.delete(url).status_code, 404)
+            self.assertEqual(
+                self.client.post(f'/api/recipes/{recipe.pk + 1}/{action}/'
+                                 ).status_code, 404)
+
+    def test_subscriptions(self):
+        url = f'/api/users/{self.other.pk}/subscribe/'
+        self.assertEqual(self.client.post(
+            f'/api/users/{self.user.pk}/subscribe/').status_code, 400)
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+
+    def test_toggles_keep_denormalized_data_consistent(self):
+        recipes = self.create_recipes(3)
+        self.assert_overlay_is_fresh()
+        for client, recipe, action, method in [
+            (self.client, recipes[0], 'favorite', 'post'),
+            (self.client, recipes[0], 'favorite', 'post'),
+            (self.other_client, recipes[0], 'favorite', 'post'),
+            (self.client, recipes[0], 'shopping_cart', 'post'),
+            (self.client, recipes[1], 'shopping_cart', 'post'),
+            (self.other_client, recipes[1], 'shopping_cart', 'post'),
+            (self.client, recipes[1], 'shopping_cart', 'delete'),
+            (self.client, recipes[1], 'shopping_cart', 'delete'),
+            (self.other_client, recipes[0], 'favorite', 'delete'),
+            (self.client, recipes[2], 'favorite', 'post'),
+        ]:
+            getattr(client, method)(f'/api/recipes/{recipe.pk}/{action}/')
+        self.other_client.post(f'/api/users/{self.user.pk}/subscribe/')
+        self.client.post(f'/api/users/{self.other.pk}/subscribe/')
+        self.client.delete(f'/api/users/{self.other.pk}/subscribe/')
+
+        self.assertEqual(
+            list(Recipe.objects.order_by('pk').values_list(
+                'favorites_count', 'carts_count')),
+            [(1, 1), (0, 1), (1, 0)])
+        self.assert_denormalized_data_is_consistent()
+        self.assert_overlay_is_fresh()
+
+
+class BatchRelationTests(RelationDataMixin, TransactionTestCase):
+
+    def statuses(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [(item['id'], item['status'])
+                for item in response.json()['results']]
+
+    def test_batch_add(self):
+        recipes = self.create_recipes(3)
+        self.assert_overlay_is_fresh()
+        missing = recipes[-1].pk + 1
+        for action in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{action}/'
+            self.client.post(f'/api/recipes/{recipes[0].pk}/{action}/')
+            response = self.client.post(url, {'recipes': [
+                recipes[0].pk, recipes[1].pk, missing, recipes[1].pk,
+                recipes[2].pk]}, format='json')
+            self.assertEqual(self.statuses(response), [
+                (recipes[0].pk, 'exists'), (recipes[1].pk, 'added'),
+                (missing, 'not_found'), (recipes[2].pk, 'added')])
+        self.other_client.post('/api/recipes/shopping_cart/',
+                               {'recipes': [recipes[1].pk]}, format='json')
+
+        self.assertEqual(
+            list(Recipe.objects.order_by('pk').values_list(
+                'favorites_count', 'carts_count')),
+            [(1, 1), (1, 2), (1, 1)])
+        self.assert_denormalized_data_is_consistent()
+        self.assert_overlay_is_fresh()
+
+    def test_batch_remove(self):
+        recipes = self.create_recipes(3)
+        ids = [recipe.pk for recipe in recipes]
+        for client in (self.client, self.other_client):
+            for action in ('favorite', 'shopping_cart'):
+                client.post(f'/api/recipes/{action}/', {'recipes': ids},
+                            format='json')
+        self.assert_overlay_is_fresh()
+        for action in ('favorite', 'shopping_cart'):
+            response = self.client.delete(
+                f'/api/recipes/{action}/',
+                {'recipes': [ids[0], ids[2], ids[2] + 1]}, format='json')
+            self.assertEqual(self.statuses(response), [
+                (ids[0], 'removed'), (ids[2], 'removed'),
+                (ids[2] + 1, 'not_found')])
+            response = self.client.delete(
+                f'/api/recipes/{action}/', {'recipes': [ids[0]]},
+                format='json')
+            self.assertEqual(self.statuses(response), [(ids[0], 'not_found')])
+
+        self.assertEqual(
+            list(Recipe.objects.order_by('pk').values_list(
+                'favorites_count', 'carts_count')),
+            [(1, 1), (2, 2), (1, 1)])
+        self.assert_denormalized_data_is_consistent()
+        self.assert_overlay_is_fresh()
@@ -1,112 +1,312 @@
-from api.mixins import GetSerializerClassMixin
+import zipfile
+from urllib.parse import urlencode
+
+from api.mixins import GetSerializerClassMixin, ReferenceCacheMixin
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.template.loader import render_to_string
 from django_filters.rest_framework import DjangoFilterBackend
+from recipes.feed import get_feed_ids
+from recipes.matching import cookable_index
 from recipes.models import (Cart, Favorite, Ingredient, IngredientAmount,
-                            Recipe, Tag)
+                            Recipe, ShoppingListItem, Tag)
+from recipes.search import ingredient_index, search_ingredients_db
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (AllowAny, IsAuthenticated,
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from users.models import Subscription
 
+from .bulk import RecipeImporter, export_recipes
+from .cache import get_stats
+from .exports import (SHOPPING_LIST_EXPORTS, SHOPPING_LIST_FIELDS,
+                      SHOPPING_LIST_RENDERERS, NDJSONStreamRenderer)
 from .filters import RecipeFilter
-from .serializers import (IngredientSerializer, RecipeCreateSerializer,
+from .fragments import render_recipes
+from .serializers import (CookableRecipeSerializer, IngredientSerializer,
+                          RecipeCreateSerializer, RecipeIdsSerializer,
                           RecipeSerializer, RecipeSubscSerializer,
                           TagSerializer)
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
     """ViewSet для модели тегов."""
+    cache_prefix = 'tags'
     permission_classes = (AllowAny,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ModelViewSet):
     """ViewSet для модели ингредиентов."""
+    cache_prefix = 'ingredients'
     permission_classes = (AllowAny,)
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = (filters.SearchFilter,)
     queryset = Ingredient.objects.all()
 
+    def get_limit(self):
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return None
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValidationError({'limit': 'Ожидается положительное число'})
+        return int(limit)
+
     def get_queryset(self):
-        name = self.request.GET.get('name')
+        name = self.request.query_params.get('name')
         if name:
-            return self.queryset.filter(
-                name__icontains=name)
-        return super().queryset
+            return search_ingredients_db(name, self.get_limit())
+        return super().get_queryset()
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and settings.INGREDIENT_SEARCH_BACKEND == 'memory':
+            return Response(ingredient_index.search(name, self.get_limit()))
+        return super().list(request, *args, **kwargs)
 
-class RecipeViewSet(GetSerializerClassMixin, viewsets.ModelViewSet):
+
+class RecipeViewSet(GetSerializerClassMixin, ReferenceCacheMixin,
+                    viewsets.ModelViewSet):
     """ViewSet для модели рецептов."""
     permission_classes = (IsAuthenticatedOrReadOnly,)
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    lookup_value_regex = r'\d+'
     serializer_class_by_action = {
         'create': RecipeCreateSerializer,
-        'partial': RecipeCreateSerializer,
+        'update': RecipeCreateSerializer,
+        'partial_update': RecipeCreateSerializer,
+        'cookable': CookableRecipeSerializer,
     }
 
-    @action(detail=True, methods=['post', 'delete'],
-            permission_classes=[IsAuthenticated])
-    def favorite(self, request, context={}, *args, **kwargs):
-        context['request'] = request
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-        user = request.user
+    serialized_actions = (
+        'list', 'retrieve', 'update', 'partial_update', 'cookable')
+    cache_prefix = 'recipes'
+    cache_query_params = ('page', 'limit', 'cursor', 'count')
+
+    def should_cache(self, request):
+        return not request.user.is_authenticated
+
+    def get_cache_path(self, request):
+        """Адрес без лишних параметров, чтобы они не дробили кэш."""
+        path = request.build_absolute_uri(request.path)
+        if self.action != 'list':
+            return path
+        names = set(self.filterset_class.base_filters)
+        names.update(self.cache_query_params)
+        query = sorted(
+            (name, value) for name in names
+            for value in request.query_params.getlist(name))
+        return f'{path}?{urlencode(query)}'
+
+    def get_cache_timeout(self):
+        return settings.RECIPE_CACHE_TIMEOUT
 
+    def get_queryset(self):
+        user = self.request.user
+        queryset = self.queryset
+        if self.action in self.serialized_actions:
+            queryset = queryset.select_related('author').prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.all()),
+                Prefetch(
+                    'ingredientamount',
+                    queryset=IngredientAmount.objects.select_related(
+                        'ingredient')),
+            )
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=BooleanField()),
+            )
+        if self.action in self.serialized_actions:
+            queryset = queryset.prefetch_related(Prefetch(
+                'author__subscribers',
+                queryset=Subscription.objects.filter(user=user),
+                to_attr='request_user_subscriptions',
+            ))
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                recipe=OuterRef('pk'), user=user)),
+            is_in_shopping_cart=Exists(Cart.objects.filter(
+                recipe=OuterRef('pk'), user=user)),
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        queryset = self.queryset.only(
+            'id', 'pub_date', 'favorites_count', 'cooking_time')
+        page = self.paginate_queryset(self.filter_queryset(queryset))
+        return self.get_paginated_response(
+            render_recipes([recipe.pk for recipe in page], request))
+
+    def toggle_relation(self, request, model, duplicate_error):
         if request.method == 'POST':
-            Favorite.objects.create(recipe=recipe, user=user)
-            serializer = RecipeSubscSerializer(recipe, context=context)
+            recipe = get_object_or_404(Recipe.objects.only(
+                'id', 'name', 'image', 'cooking_time'), id=self.kwargs['pk'])
+            if model.objects.add_relation(request.user.id, recipe.id) is None:
+                raise ValidationError(duplicate_error)
+            serializer = RecipeSubscSerializer(
+                recipe, context={'request': request})
             return Response(serializer.data, status.HTTP_201_CREATED)
 
-        get_object_or_404(Favorite, recipe=recipe, user=user).delete()
+        removed = model.objects.remove_relation(
+            request.user.id, self.kwargs['pk'])
+        if removed is None:
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
-    def shopping_cart(self, request, context={}, *args, **kwargs):
-        context['request'] = request
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-        user = request.user
+    def favorite(self, request, *args, **kwargs):
+        return self.toggle_relation(
+            request, Favorite, 'Рецепт уже есть в избранном')
+
+    @action(detail=True, methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated])
+    def shopping_cart(self, request, *args, **kwargs):
+        return self.toggle_relation(
+            request, Cart, 'Рецепт уже есть в корзине')
 
+    def batch_relations(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['recipes']))
         if request.method == 'POST':
-            Cart.objects.create(recipe=recipe, user=user)
-            serializer = RecipeSubscSerializer(recipe, context=context)
-            return Response(serializer.data, status.HTTP_201_CREATED)
+            changed = model.objects.add_relations(request.user.id, ids)
+            missing = set(ids) - changed
+            existing = set(Recipe.objects.filter(pk__in=missing).values_list(
+                'pk', flat=True)) if missing else set()
+            statuses = {pk: 'added' if pk in changed
+                        else 'exists' if pk in existing else 'not_found'
+                        for pk in ids}
+        else:
+            changed = model.objects.remove_relations(request.user.id, ids)
+            statuses = {pk: 'removed' if pk in changed else 'not_found'
+                        for pk in ids}
+        return Response({'results': [
+            {'id': pk, 'status': statuses[pk]} for pk in ids]})
 
-        get_object_or_404(Cart, recipe=recipe, user=user).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    @action(detail=False, methods=['post', 'delete'], url_path='favorite',
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request, *args, **kwargs):
+        return self.batch_relations(request, Favorite)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
-    def download_shopping_cart(self, request, context={}, *args, **kwargs):
-        context['request'] = self.request
-        user = request.user
-        queryset = IngredientAmount.objects.filter(
-            recipe__recipe_carts__user=user).values(
-            'ingredient__name', 'ingredient__measurement_unit').annotate(
-            total_amount=Sum('amount')
-        ).order_by()
-
-        shopping_list = render_to_string(
-            'shopping_list.txt', {'shopping_list': queryset}
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart', permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request, *args, **kwargs):
+        return self.batch_relations(request, Cart)
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
+    def download_shopping_cart(self, request, *args, **kwargs):
+        export_format = request.accepted_renderer.format
+        items = ShoppingListItem.objects.filter(user=request.user).values(
+            *SHOPPING_LIST_FIELDS).iterator(chunk_size=500)
+        response = StreamingHttpResponse(
+            SHOPPING_LIST_EXPORTS[export_format](items),
+            content_type=(f'{request.accepted_renderer.media_type}; '
+                          f'charset={request.accepted_renderer.charset}'),
         )
-        shopping_list = shopping_list.strip().replace('\n\n', '\n')
-        response = HttpResponse(shopping_list, content_type='text/plain')
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_list.txt"'
+            f'attachment; filename="shopping_list.{export_format}"'
         )
         return response
 
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request, *args, **kwargs):
+        ids = None
+        if self.paginator.cursor_query_param not in request.query_params:
+            ids = get_feed_ids(request.user)
+        if ids is None:
+            page = self.paginate_queryset(self.queryset.filter(
+                author__subscribers__user=request.user).order_by(
+                '-pub_date', '-id'))
+            ids = [recipe.pk for recipe in page]
+        else:
+            ids = self.paginate_queryset(ids)
+        return self.get_paginated_response(render_recipes(ids, request))
+
+    @action(detail=False)
+    def cookable(self, request, *args, **kwargs):
+        try:
+            available = {
+                int(pk) for value in request.query_params.getlist(
+                    'ingredients') for pk in value.split(',')}
+            max_missing = request.query_params.get('max_missing')
+            if max_missing is not None:
+                max_missing = int(max_missing)
+        except ValueError:
+            raise ValidationError('Ожидаются числовые id ингредиентов')
+        if not available:
+            raise ValidationError(
+                {'ingredients': 'Укажите хотя бы один ингредиент'})
+        page = self.paginate_queryset(
+            cookable_index.match(available, max_missing))
+        recipes = self.get_queryset().in_bulk([pk for pk, _ in page])
+        serializer = self.get_serializer(
+            [recipes[pk] for pk, _ in page if pk in recipes], many=True,
+            context={**self.get_serializer_context(), 'available': available})
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def cache_stats(self, request, *args, **kwargs):
+        return Response({
+            prefix: get_stats(prefix)
+            for prefix in ('recipes', 'tags', 'ingredients')
+        })
+
+    @action(detail=False, methods=['post'],
+            permission_classes=[IsAuthenticated])
+    def bulk(self, request, *args, **kwargs):
+        batch_size = request.query_params.get('batch_size', '100')
+        if not batch_size.isdigit() or not 0 < int(batch_size) <= 1000:
+            raise ValidationError(
+                {'batch_size': 'Ожидается число от 1 до 1000'})
+        archive = None
+        if request.content_type.startswith('multipart/'):
+            if 'recipes' not in request.FILES:
+                raise ValidationError({'recipes': 'Файл NDJSON обязателен'})
+            lines = request.FILES['recipes']
+            if 'images' in request.FILES:
+                try:
+                    archive = zipfile.ZipFile(request.FILES['images'])
+                except zipfile.BadZipFile:
+                    raise ValidationError({'images': 'Ожидается zip-архив'})
+        else:
+            lines = request.stream or []
+        importer = RecipeImporter(
+            request.user, batch_size=int(batch_size), archive=archive)
+        results = list(importer.run(lines))
+        created = sum(result['status'] == 'created' for result in results)
+        return Response({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results,
+        })
+
+    @action(detail=False, permission_classes=[IsAdminUser],
+            renderer_classes=(NDJSONStreamRenderer,))
+    def export(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(
+            export_recipes(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"')
+        return response
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
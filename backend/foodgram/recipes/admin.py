@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from .models import (Cart, Favorite, Ingredient, IngredientAmount, Recipe,
-                     RecipeTag, Tag)
+                     RecipeTag, ShoppingListItem, Tag)
 
 
 class TagInline(admin.TabularInline):
@@ -23,7 +23,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author', 'name', 'tags')
 
     def favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     favorites.short_description = 'В избранном'
 
@@ -40,3 +40,4 @@ admin.site.register(RecipeTag)
 admin.site.register(IngredientAmount)
 admin.site.register(Favorite)
 admin.site.register(Cart)
+admin.site.register(ShoppingListItem)
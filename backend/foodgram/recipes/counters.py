@@ -0,0 +1,48 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from users.models import Subscription
+
+from .models import Cart, Favorite, Recipe
+
+User = get_user_model()
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', Cart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def change_counters(model, pks, field, delta):
+    model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def actual_count(related_model, related_field):
+    return Coalesce(Subquery(
+        related_model.objects.filter(**{related_field: OuterRef('pk')})
+        .order_by().values(related_field)
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def reconcile_counters(fix=True):
+    """Сверяет счётчики с фактическими данными и исправляет расхождения.
+
+    Возвращает число строк с расхождением для каждого счётчика.
+    """
+    drift = {}
+    for model, field, related_model, related_field in COUNTERS:
+        stale = model.objects.annotate(
+            actual=actual_count(related_model, related_field)
+        ).filter(~Q(**{field: F('actual')})).values_list('pk', flat=True)
+        drift[f'{model.__name__}.{field}'] = stale.count()
+        if fix:
+            model.objects.filter(pk__in=list(stale)).update(
+                **{field: actual_count(related_model, related_field)})
+    return drift
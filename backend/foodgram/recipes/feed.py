@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.cache import cache
+from users.models import Subscription
+
+from .models import Recipe
+
+
+def feed_key(user_id):
+    return f'feed:{user_id}'
+
+
+def followed_recipes(user):
+    return Recipe.objects.filter(
+        author__subscribers__user=user).order_by('-pub_date', '-id')
+
+
+def get_feed_ids(user):
+    """id рецептов ленты пользователя из кэша, новые первыми.
+
+    Возвращает None, если лента пользователя не кэшируется и её нужно
+    строить запросом по подпискам.
+    """
+    if not settings.FEED_FANOUT:
+        return None
+    ids = cache.get(feed_key(user.pk))
+    if ids is not None:
+        return ids
+    if user.subscriptions.count() > settings.FEED_FANOUT_MAX_FOLLOWING:
+        return None
+    ids = list(followed_recipes(user).values_list(
+        'id', flat=True)[:settings.FEED_MAX_LENGTH + 1])
+    if len(ids) > settings.FEED_MAX_LENGTH:
+        return None
+    cache.set(feed_key(user.pk), ids, settings.FEED_TTL)
+    return ids
+
+
+def push_recipe(recipe_id, author_id):
+    """Добавляет новый рецепт в закэшированные ленты подписчиков."""
+    if not settings.FEED_FANOUT:
+        return
+    keys = [feed_key(user_id) for user_id in Subscription.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)]
+    feeds = cache.get_many(keys)
+    overflow = [key for key, ids in feeds.items()
+                if len(ids) >= settings.FEED_MAX_LENGTH]
+    cache.delete_many(overflow)
+    cache.set_many({
+        key: [recipe_id] + ids for key, ids in feeds.items()
+        if key not in overflow
+    }, settings.FEED_TTL)
+
+
+def drop_feeds(user_ids):
+    cache.delete_many([feed_key(user_id) for user_id in user_ids])
+
+
+def drop_followers_feeds(author_id):
+    drop_feeds(Subscription.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
@@ -0,0 +1,87 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .storage import recipe_image_storage as storage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def rendition_name(name, rendition):
+    root, _ = os.path.splitext(name)
+    extension = settings.RECIPE_IMAGE_FORMAT.lower()
+    return f'{root}.{rendition}.{extension}'
+
+
+def make_renditions(source_path, targets, image_format):
+    """Создаёт уменьшенные копии картинки; выполняется в пуле процессов."""
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for target_path, size in targets:
+            rendition = image.copy()
+            rendition.thumbnail(size)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            rendition.save(target_path, image_format, quality=80)
+
+
+def rendition_targets(name):
+    return [
+        (storage.path(rendition_name(name, rendition)), size)
+        for rendition, size in settings.RECIPE_IMAGE_RENDITIONS.items()
+        if not storage.exists(rendition_name(name, rendition))
+    ]
+
+
+def log_failure(future, name):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error('Не удалось создать копии картинки %s', name,
+                     exc_info=error)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS)
+    return _executor
+
+
+def schedule_renditions(name):
+    """Ставит в очередь создание недостающих копий картинки."""
+    global _executor
+    targets = rendition_targets(name)
+    if not targets:
+        return
+    try:
+        future = get_executor().submit(
+            make_renditions, storage.path(name), targets,
+            settings.RECIPE_IMAGE_FORMAT)
+    except BrokenProcessPool:
+        logger.exception('Пул обработки картинок недоступен: %s', name)
+        _executor = None
+        return
+    future.add_done_callback(partial(log_failure, name=name))
+
+
+def rendition_urls(image):
+    """URL копий картинки; пока копия не готова, отдаётся оригинал."""
+    urls = {}
+    for rendition in settings.RECIPE_IMAGE_RENDITIONS:
+        name = rendition_name(image.name, rendition)
+        urls[rendition] = (
+            storage.url(name) if storage.exists(name)
+            else image.url
+        )
+    return urls
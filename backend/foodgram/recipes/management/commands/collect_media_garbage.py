@@ -0,0 +1,60 @@
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.images import rendition_name
+from recipes.models import Recipe
+from recipes.storage import recipe_image_storage
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки рецептов, на которые нет ссылок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать файлы, которые будут удалены.')
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='Не трогать файлы моложе указанного числа минут.')
+
+    def handle(self, *args, **options):
+        references = self.count_references()
+        keep = set(references)
+        for name in references:
+            keep.update(
+                rendition_name(name, rendition)
+                for rendition in settings.RECIPE_IMAGE_RENDITIONS)
+        threshold = timezone.now() - timedelta(minutes=options['min_age'])
+        removed = 0
+        for name in self.walk('recipes'):
+            if name in keep:
+                continue
+            if recipe_image_storage.get_modified_time(name) > threshold:
+                continue
+            removed += 1
+            self.stdout.write(name)
+            if not options['dry_run']:
+                recipe_image_storage.delete(name)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, '
+            f'используется файлов: {len(references)}'))
+
+    def count_references(self):
+        references = {}
+        for name in Recipe.objects.exclude(image='').values_list(
+                'image', flat=True).iterator():
+            references[name] = references.get(name, 0) + 1
+        return references
+
+    def walk(self, path):
+        if not recipe_image_storage.exists(path):
+            return
+        directories, files = recipe_image_storage.listdir(path)
+        for name in files:
+            yield posixpath.join(path, name)
+        for directory in directories:
+            yield from self.walk(posixpath.join(path, directory))
@@ -0,0 +1,21 @@
+import sys
+
+from api.bulk import export_recipes
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Выгружает все рецепты в NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            sys.stdout.writelines(export_recipes(options['chunk_size']))
+            return
+        with open(options['path'], 'w', encoding='utf-8') as file:
+            file.writelines(export_recipes(options['chunk_size']))
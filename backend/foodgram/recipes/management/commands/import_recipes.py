@@ -0,0 +1,46 @@
+import json
+import sys
+import zipfile
+
+from api.bulk import RecipeImporter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Импортирует рецепты из NDJSON-файла пачками.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON-файл или "-" для stdin')
+        parser.add_argument(
+            '--author', required=True, help='Логин автора рецептов')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--images', help='zip-архив с картинками для archive:<имя>')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['author'])
+        except User.DoesNotExist:
+            raise CommandError(f'Нет пользователя {options["author"]}')
+        archive = options['images'] and zipfile.ZipFile(options['images'])
+        importer = RecipeImporter(
+            author, batch_size=options['batch_size'], archive=archive)
+        if options['path'] == '-':
+            created, failed = self.report(importer.run(sys.stdin))
+        else:
+            with open(options['path'], encoding='utf-8') as file:
+                created, failed = self.report(importer.run(file))
+        self.stderr.write(f'Создано {created}, с ошибками {failed}')
+
+    def report(self, results):
+        created = failed = 0
+        for result in results:
+            if result['status'] == 'created':
+                created += 1
+            else:
+                failed += 1
+            self.stdout.write(json.dumps(result, ensure_ascii=False))
+        return created, failed
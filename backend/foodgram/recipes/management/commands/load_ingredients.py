@@ -0,0 +1,146 @@
+import csv
+import json
+import os
+import time
+
+from api.cache import invalidate
+from api.exports import Echo
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.models import Ingredient
+from recipes.search import ingredient_index
+
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+class RowStream:
+    """Файлоподобная обёртка над строками для COPY FROM STDIN."""
+
+    def __init__(self, rows):
+        writer = csv.writer(Echo())
+        self._lines = (writer.writerow(row) for row in rows)
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row
+
+
+def read_json(file, chunk_size=65536):
+    """Потоково читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise CommandError('Ожидается JSON-массив')
+                buffer, started = buffer[1:], True
+                continue
+            buffer = buffer.lstrip(', \t\r\n')
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                break
+            buffer = buffer[end:]
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            raise CommandError('Неожиданный конец JSON-файла')
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON без дубликатов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'))
+        parser.add_argument('--format', choices=('csv', 'json'))
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1][1:]
+        readers = {'csv': read_csv, 'json': read_json}
+        if file_format not in readers:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        self.read = self.skipped = 0
+        started = time.monotonic()
+        with open(path, encoding='utf-8') as file:
+            rows = self.clean_rows(readers[file_format](file))
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    created = self.copy(rows)
+                else:
+                    created = self.bulk_create(rows, options['batch_size'])
+        elapsed = max(time.monotonic() - started, 1e-6)
+        ingredient_index.invalidate()
+        invalidate('ingredients')
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {self.read}, добавлено {created}, '
+            f'пропущено {self.skipped} '
+            f'({self.read / elapsed:.0f} строк/с)'))
+
+    def clean_rows(self, rows):
+        for name, measurement_unit in rows:
+            self.read += 1
+            name, measurement_unit = name.strip(), measurement_unit.strip()
+            if (not name or not measurement_unit
+                    or len(name) > NAME_LENGTH
+                    or len(measurement_unit) > UNIT_LENGTH):
+                self.skipped += 1
+                continue
+            yield name, measurement_unit
+
+    def copy(self, rows):
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP')
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', RowStream(rows))
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING')
+            return cursor.rowcount
+
+    def bulk_create(self, rows, batch_size):
+        """Повторы отбрасывает уникальное ограничение (name,
+        measurement_unit), в том числе при параллельной загрузке."""
+        before = Ingredient.objects.count()
+        batch = []
+        for name, measurement_unit in rows:
+            batch.append(Ingredient(name=name,
+                                    measurement_unit=measurement_unit))
+            if len(batch) >= batch_size:
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        return Ingredient.objects.count() - before
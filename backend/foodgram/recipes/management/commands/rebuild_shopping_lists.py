@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает или проверяет агрегированные списки покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить таблицу с корзинами, не изменяя её.')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_consistency()
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано позиций: {ShoppingListItem.objects.count()}'))
+
+    def check_consistency(self):
+        expected = {
+            (item['recipe__recipe_carts__user'], item['ingredient']):
+            item['total_amount']
+            for item in ShoppingListItem.objects.expected()
+        }
+        stored = {
+            (item['user'], item['ingredient']): item['total_amount']
+            for item in ShoppingListItem.objects.values(
+                'user', 'ingredient', 'total_amount')
+        }
+        mismatches = [
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        ]
+        for user_id, ingredient_id in mismatches:
+            self.stderr.write(
+                f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'ожидалось {expected.get((user_id, ingredient_id))}, '
+                f'в таблице {stored.get((user_id, ingredient_id))}')
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
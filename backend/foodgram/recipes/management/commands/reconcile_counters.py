@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет и исправляет денормализованные счётчики.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только показать расхождения, не исправляя их.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = reconcile_counters(fix=not options['check'])
+        for counter, stale in drift.items():
+            self.stdout.write(f'{counter}: расхождений {stale}')
+        action = 'Найдено' if options['check'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} строк: {sum(drift.values())}'))
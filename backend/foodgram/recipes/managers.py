@@ -0,0 +1,117 @@
+from django.db import connections, models
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal
+
+# Пакетные изменения не отправляют сигналы по каждой записи: получатели
+# узнают id пользователя и множество id объектов.
+relations_added = Signal()
+relations_removed = Signal()
+
+
+class RelationManager(models.Manager):
+    """Связь пользователя с объектом, которая ставится и снимается
+    одним запросом.
+
+    Сырой SQL не вызывает сигналы модели, поэтому после изменения они
+    отправляются вручную: от них зависят счётчики, список покупок и кэши.
+    """
+
+    def __init__(self, target_field=None):
+        super().__init__()
+        self.target_field = target_field
+
+    def get_columns(self, connection):
+        opts = self.model._meta
+        target = opts.get_field(self.target_field)
+        quote = connection.ops.quote_name
+        return (quote(opts.db_table), quote(opts.get_field('user').column),
+                quote(target.column),
+                quote(target.related_model._meta.db_table),
+                target.attname)
+
+    def make_instance(self, pk, user_id, target_id, attname):
+        return self.model(pk=pk, user_id=user_id, **{attname: target_id})
+
+    def add_relation(self, user_id, target_id):
+        """Создаёт связь; None, если она уже есть или объекта нет."""
+        connection = connections[self.db]
+        table, user, target, target_table, attname = self.get_columns(
+            connection)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {target}) '
+                f'SELECT %s, id FROM {target_table} WHERE id = %s '
+                'ON CONFLICT DO NOTHING RETURNING id',
+                [user_id, target_id])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        instance = self.make_instance(row[0], user_id, target_id, attname)
+        post_save.send(sender=self.model, instance=instance, created=True,
+                       update_fields=None, raw=False, using=self.db)
+        return instance
+
+    def remove_relation(self, user_id, target_id):
+        """Удаляет связь; None, если её не было."""
+        connection = connections[self.db]
+        table, user, target, _, attname = self.get_columns(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {user} = %s AND {target} = %s '
+                'RETURNING id',
+                [user_id, target_id])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        instance = self.make_instance(row[0], user_id, target_id, attname)
+        # pre_delete отправляется, когда строки уже нет: получатели должны
+        # обходиться полями instance, не перечитывая запись из базы.
+        for signal in (pre_delete, post_delete):
+            signal.send(sender=self.model, instance=instance, using=self.db)
+        return instance
+
+    def add_relations(self, user_id, target_ids):
+        """Создаёт связи с несколькими объектами одним запросом.
+
+        Возвращает множество id объектов, связь с которыми создана.
+        """
+        target_ids = list(target_ids)
+        if not target_ids:
+            return set()
+        connection = connections[self.db]
+        table, user, target, target_table, _ = self.get_columns(connection)
+        placeholders = ', '.join(['%s'] * len(target_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {target}) '
+                f'SELECT %s, id FROM {target_table} '
+                f'WHERE id IN ({placeholders}) '
+                f'ON CONFLICT DO NOTHING RETURNING {target}',
+                [user_id, *target_ids])
+            added = {row[0] for row in cursor.fetchall()}
+        if added:
+            relations_added.send(
+                sender=self.model, user_id=user_id, target_ids=added)
+        return added
+
+    def remove_relations(self, user_id, target_ids):
+        """Удаляет связи с несколькими объектами одним запросом.
+
+        Возвращает множество id объектов, связь с которыми удалена.
+        """
+        target_ids = list(target_ids)
+        if not target_ids:
+            return set()
+        connection = connections[self.db]
+        table, user, target, _, _ = self.get_columns(connection)
+        placeholders = ', '.join(['%s'] * len(target_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {user} = %s '
+                f'AND {target} IN ({placeholders}) RETURNING {target}',
+                [user_id, *target_ids])
+            removed = {row[0] for row in cursor.fetchall()}
+        if removed:
+            relations_removed.send(
+                sender=self.model, user_id=user_id, target_ids=removed)
+        return removed
@@ -0,0 +1,271 @@
+import threading
+import time
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import IngredientAmount
+
+# Редкий ингредиент хранится массивом id рецептов (4 байта на рецепт),
+# частый - битовой картой (max_id / 8 байт). Массив выгоднее, пока
+# ингредиент встречается реже чем в каждом 32-м рецепте.
+DENSE_RATIO = 32
+
+
+def popcount(bitmap):
+    return bin(bitmap).count('1')
+
+
+def iter_bits(bitmap):
+    """Номера установленных битов от старшего к младшему."""
+    bits = bin(bitmap)[2:]
+    top = len(bits) - 1
+    position = bits.find('1')
+    while position != -1:
+        yield top - position
+        position = bits.find('1', position + 1)
+
+
+def add_to_planes(planes, bitmap):
+    """Прибавляет битовую карту к побитовому счётчику.
+
+    planes[i] хранит i-й разряд счётчика для каждого рецепта, так что
+    сложение идёт сразу по всем рецептам, как в сумматоре.
+    """
+    carry = bitmap
+    for number, plane in enumerate(planes):
+        if not carry:
+            return
+        planes[number], carry = plane ^ carry, plane & carry
+    if carry:
+        planes.append(carry)
+
+
+def equal_to(planes, value, mask):
+    """Рецепты из mask, у которых значение счётчика равно value."""
+    if value >> len(planes):
+        return 0
+    for number, plane in enumerate(planes):
+        mask &= plane if value >> number & 1 else ~plane
+    return mask
+
+
+class RankedRecipes:
+    """Отсортированная выдача поверх групп битовых карт.
+
+    Считает длину без раскрытия битов и раскрывает только группы,
+    попавшие в запрошенный срез, поэтому пагинатор работает с ней как со
+    списком пар (id рецепта, число недостающих ингредиентов).
+    """
+
+    def __init__(self, groups):
+        self.groups = [(missing, bitmap, popcount(bitmap))
+                       for missing, bitmap in groups]
+        self.total = sum(size for _, _, size in self.groups)
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(self.total)
+        result = []
+        offset = 0
+        for missing, bitmap, size in self.groups:
+            if offset >= stop:
+                break
+            if offset + size > start:
+                skip = max(start - offset, 0)
+                for number, pk in enumerate(iter_bits(bitmap)):
+                    if offset + number >= stop:
+                        break
+                    if number >= skip:
+                        result.append((pk, missing))
+            offset += size
+        return result
+
+
+def bitmap_from_ids(ids):
+    """Битовая карта из списка номеров, собранная за один проход."""
+    if not ids:
+        return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for pk in ids:
+        data[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(data, 'little')
+
+
+def read_recipes(recipe_ids=None):
+    """Состав рецептов {id рецепта: множество id ингредиентов}."""
+    amounts = IngredientAmount.objects.all()
+    if recipe_ids is not None:
+        amounts = amounts.filter(recipe_id__in=list(recipe_ids))
+    recipes = defaultdict(set)
+    for recipe_id, ingredient_id in amounts.values_list(
+            'recipe_id', 'ingredient_id').iterator():
+        recipes[recipe_id].add(ingredient_id)
+    return recipes
+
+
+class RecipeBitmaps:
+    """Списки рецептов по ингредиентам и битовые карты по числу
+    ингредиентов."""
+
+    def __init__(self, recipes):
+        postings = defaultdict(list)
+        by_size = defaultdict(list)
+        for recipe_id, ingredients in recipes.items():
+            by_size[len(ingredients)].append(recipe_id)
+            for ingredient_id in ingredients:
+                postings[ingredient_id].append(recipe_id)
+        top = max(recipes, default=0)
+        self.postings = {
+            pk: (bitmap_from_ids(ids) if len(ids) * DENSE_RATIO > top
+                 else array('I', ids))
+            for pk, ids in postings.items()
+        }
+        self.by_size = defaultdict(int, {
+            size: bitmap_from_ids(ids) for size, ids in by_size.items()})
+        self.recipes = {
+            pk: array('I', ingredients) for pk, ingredients in recipes.items()
+            if ingredients}
+
+    def add(self, ingredient_id, recipe_id):
+        posting = self.postings.setdefault(ingredient_id, array('I'))
+        if isinstance(posting, int):
+            self.postings[ingredient_id] = posting | 1 << recipe_id
+        else:
+            posting.append(recipe_id)
+
+    def discard(self, ingredient_id, recipe_id):
+        posting = self.postings[ingredient_id]
+        if isinstance(posting, int):
+            self.postings[ingredient_id] = posting & ~(1 << recipe_id)
+        else:
+            posting.remove(recipe_id)
+
+    def set(self, recipe_id, ingredients):
+        """Заменяет состав одного рецепта."""
+        bit = 1 << recipe_id
+        old = set(self.recipes.pop(recipe_id, ()))
+        if old:
+            self.by_size[len(old)] &= ~bit
+        for ingredient_id in old - ingredients:
+            self.discard(ingredient_id, recipe_id)
+        for ingredient_id in ingredients - old:
+            self.add(ingredient_id, recipe_id)
+        if ingredients:
+            self.by_size[len(ingredients)] |= bit
+            self.recipes[recipe_id] = array('I', ingredients)
+
+
+class CookableIndex:
+    """Обратный индекс ингредиент -> рецепты.
+
+    Для запроса списки рецептов превращаются в битовые карты, где номер
+    бита равен id рецепта. Побитовые операции над целыми Python
+    выполняются сразу над всей картой, что заменяет векторизацию.
+    Индекс обновляется по одному рецепту в процессе, где рецепт изменили,
+    а остальные процессы перестраивают его по TTL. Перестройка идёт вне
+    блокировки: пока новый индекс не готов, запросы читают старый.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._index = None
+        self._built_at = 0
+        self._dirty = None
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = 0
+
+    def _is_fresh(self):
+        return (self._index is not None
+                and time.monotonic() - self._built_at <= self.ttl)
+
+    def _rebuild(self):
+        with self._lock:
+            if self._is_fresh():
+                return
+            # Изменения, пришедшие во время перестройки, применяются к
+            # новому индексу перед заменой.
+            self._dirty = set()
+        index = RecipeBitmaps(read_recipes())
+        with self._lock:
+            changes = read_recipes(self._dirty)
+            for recipe_id in self._dirty:
+                index.set(recipe_id, changes[recipe_id])
+            self._index = index
+            self._built_at = time.monotonic()
+            self._dirty = None
+
+    def _load(self):
+        with self._lock:
+            if self._is_fresh():
+                return self._index
+            index = self._index
+        # Без готового индекса ждём перестройку, иначе её делает один
+        # поток, а остальные читают старый индекс.
+        if self._build_lock.acquire(blocking=index is None):
+            try:
+                self._rebuild()
+            finally:
+                self._build_lock.release()
+        with self._lock:
+            return self._index
+
+    def update(self, recipe_ids):
+        """Перечитывает состав указанных рецептов из базы."""
+        recipe_ids = list(recipe_ids)
+        changes = read_recipes(recipe_ids)
+        with self._lock:
+            if self._dirty is not None:
+                self._dirty.update(recipe_ids)
+            if self._index is None:
+                return
+            for recipe_id in recipe_ids:
+                self._index.set(recipe_id, changes[recipe_id])
+
+    def match(self, ingredient_ids, max_missing=None):
+        """Рецепты, в которых есть хотя бы один из ингредиентов.
+
+        Сначала те, что можно приготовить целиком, затем по числу
+        недостающих ингредиентов и новые первыми.
+        """
+        index = self._load()
+        with self._lock:
+            # Массивы меняются на месте, поэтому копируются под блокировкой.
+            postings = [index.postings.get(pk, 0)
+                        for pk in set(ingredient_ids)]
+            postings = [posting if isinstance(posting, int) else posting[:]
+                        for posting in postings]
+            by_size = dict(index.by_size)
+        postings = [bitmap_from_ids(posting)
+                    if not isinstance(posting, int) else posting
+                    for posting in postings]
+        planes = []
+        candidates = 0
+        for bitmap in postings:
+            add_to_planes(planes, bitmap)
+            candidates |= bitmap
+        groups = []
+        for matched in range(1, len(postings) + 1):
+            exact = equal_to(planes, matched, candidates)
+            if not exact:
+                continue
+            for size, sized in by_size.items():
+                missing = size - matched
+                if max_missing is not None and missing > max_missing:
+                    continue
+                group = exact & sized
+                if group:
+                    groups.append(((missing, -matched), group))
+        groups.sort(key=lambda group: group[0])
+        return RankedRecipes(
+            (missing, group) for (missing, _), group in groups)
+
+
+cookable_index = CookableIndex(ttl=settings.COOKABLE_INDEX_TTL)
@@ -0,0 +1,42 @@
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector '
+        'ON recipes_recipe USING gin (search_vector)')
+    schema_editor.execute(
+        "UPDATE recipes_recipe AS r SET search_vector = "
+        "setweight(to_tsvector(%s::regconfig, r.name), 'A') || "
+        "setweight(to_tsvector(%s::regconfig, coalesce(("
+        "SELECT string_agg(i.name, ' ') FROM recipes_ingredientamount a "
+        "JOIN recipes_ingredient i ON i.id = a.ingredient_id "
+        "WHERE a.recipe_id = r.id), '')), 'B') || "
+        "setweight(to_tsvector(%s::regconfig, r.text), 'C')",
+        [settings.RECIPE_SEARCH_CONFIG] * 3)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipes_recipe_search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
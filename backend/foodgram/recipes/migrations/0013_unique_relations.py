@@ -0,0 +1,66 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:16
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def delete_duplicates(model):
+    """Оставляет самую раннюю запись каждой пары, возвращает число
+    удалённых."""
+    keep = model.objects.values('user', 'recipe').annotate(
+        first=Min('id')).order_by().values_list('first', flat=True)
+    deleted, _ = model.objects.exclude(id__in=list(keep)).delete()
+    return deleted
+
+
+def count_related(model):
+    return Coalesce(Subquery(
+        model.objects.filter(recipe=OuterRef('pk')).order_by()
+        .values('recipe').annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def remove_duplicates(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Cart = apps.get_model('recipes', 'Cart')
+    deleted_favorites = delete_duplicates(Favorite)
+    deleted_carts = delete_duplicates(Cart)
+    if not deleted_favorites and not deleted_carts:
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(favorites_count=count_related(Favorite),
+                          carts_count=count_related(Cart))
+    if deleted_carts:
+        IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+        ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+        ShoppingListItem.objects.all().delete()
+        totals = IngredientAmount.objects.filter(
+            recipe__recipe_carts__isnull=False).values(
+            'recipe__recipe_carts__user', 'ingredient').annotate(
+            total_amount=Sum('amount')).order_by()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(user_id=item['recipe__recipe_carts__user'],
+                             ingredient_id=item['ingredient'],
+                             total_amount=item['total_amount'])
+            for item in totals
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_cart'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+    ]
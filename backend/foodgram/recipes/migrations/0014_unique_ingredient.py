@@ -0,0 +1,55 @@
+# Generated by Django 2.2.16 on 2026-10-18 22:05
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """Переносит ссылки с повторов ингредиента на самую раннюю запись и
+    удаляет повторы."""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    first = {}
+    duplicates = {}
+    for pk, name, measurement_unit in Ingredient.objects.order_by(
+            'id').values_list('id', 'name', 'measurement_unit').iterator():
+        key = (name, measurement_unit)
+        if key in first:
+            duplicates.setdefault(first[key], []).append(pk)
+        else:
+            first[key] = pk
+    if not duplicates:
+        return
+    for keep, ids in duplicates.items():
+        IngredientAmount.objects.filter(ingredient_id__in=ids).update(
+            ingredient_id=keep)
+    removed = [pk for ids in duplicates.values() for pk in ids]
+    if ShoppingListItem.objects.filter(ingredient_id__in=removed).exists():
+        ShoppingListItem.objects.all().delete()
+        totals = IngredientAmount.objects.filter(
+            recipe__recipe_carts__isnull=False).values(
+            'recipe__recipe_carts__user', 'ingredient').annotate(
+            total_amount=Sum('amount')).order_by()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(user_id=item['recipe__recipe_carts__user'],
+                             ingredient_id=item['ingredient'],
+                             total_amount=item['total_amount'])
+            for item in totals
+        )
+    Ingredient.objects.filter(id__in=removed).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_unique_relations'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
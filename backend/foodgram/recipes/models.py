@@ -1,8 +1,13 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import F, Sum
 from rest_framework.exceptions import ValidationError
 
+from .managers import RelationManager
+from .storage import recipe_image_storage
+
 User = get_user_model()
 
 
@@ -17,6 +22,11 @@ class Ingredient(models.Model):
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
         ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "measurement_unit"],
+                name="unique_ingredient"),
+        ]
 
     def __str__(self):
         return self.name
@@ -71,12 +81,29 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField(
         "Дата добавления", auto_now_add=True, db_index=True)
-    image = models.ImageField(upload_to="recipes/", verbose_name="Картинка")
+    image = models.ImageField(
+        upload_to="recipes/", storage=recipe_image_storage,
+        verbose_name="Картинка")
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В избранном")
+    carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В списках покупок")
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_newest_idx"),
+            models.Index(
+                fields=["-favorites_count", "-pub_date", "-id"],
+                name="recipe_popularity_idx"),
+            models.Index(
+                fields=["cooking_time", "-pub_date", "-id"],
+                name="recipe_cooking_time_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -146,6 +173,8 @@ class Favorite(models.Model):
         verbose_name="В избранном у",
     )
 
+    objects = RelationManager("recipe")
+
     def clean(self):
         if Favorite.objects.filter(
                 user=self.user, recipe=self.recipe).exists():
@@ -159,6 +188,10 @@ class Favorite(models.Model):
         verbose_name = "Избранное"
         verbose_name_plural = "Избранное"
         ordering = ["-recipe"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"], name="unique_favorite"),
+        ]
 
     def __str__(self):
         return f"Рецепт {self.recipe}, в избранном у {self.user}"
@@ -180,6 +213,8 @@ class Cart(models.Model):
         verbose_name="Владелец списка покупок",
     )
 
+    objects = RelationManager("recipe")
+
     def clean(self):
         if Cart.objects.filter(user=self.user, recipe=self.recipe).exists():
             raise ValidationError('Рецепт уже есть в корзине')
@@ -192,6 +227,108 @@ class Cart(models.Model):
         verbose_name = "Список покупок"
         verbose_name_plural = "Списки покупок"
         ordering = ["-recipe"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"], name="unique_cart"),
+        ]
 
     def __str__(self):
         return f"Рецепт {self.recipe}, в списке покупок у {self.user}"
+
+
+class ShoppingListManager(models.Manager):
+    """Инкрементальное обновление списков покупок."""
+
+    def add_recipe(self, recipe, users=None):
+        self.change_amounts(recipe, self.recipe_amounts(recipe), users)
+
+    def remove_recipe(self, recipe, users=None):
+        amounts = self.recipe_amounts(recipe)
+        self.change_amounts(
+            recipe, {key: -value for key, value in amounts.items()}, users)
+
+    def add_recipes(self, recipes, users):
+        """Добавляет в списки покупок сразу несколько рецептов."""
+        self.change_amounts(None, self.recipes_amounts(recipes), users)
+
+    def remove_recipes(self, recipes, users):
+        amounts = self.recipes_amounts(recipes)
+        self.change_amounts(
+            None, {key: -value for key, value in amounts.items()}, users)
+
+    def recipe_amounts(self, recipe):
+        return self.recipes_amounts([recipe])
+
+    def recipes_amounts(self, recipes):
+        amounts = IngredientAmount.objects.filter(recipe__in=recipes).values(
+            'ingredient').annotate(total=Sum('amount')).order_by()
+        return {item['ingredient']: item['total'] for item in amounts}
+
+    def change_amounts(self, recipe, deltas, users=None):
+        """Применяет изменения количеств {ингредиент: дельта} к спискам
+        покупок пользователей, у которых рецепт в корзине."""
+        if users is None:
+            users = Cart.objects.filter(recipe=recipe).values_list(
+                'user', flat=True)
+        user_ids = [getattr(user, 'pk', user) for user in users]
+        deltas = {key: value for key, value in deltas.items() if value}
+        if not user_ids or not deltas:
+            return
+        self.bulk_create(
+            [self.model(user_id=user_id, ingredient_id=ingredient_id,
+                        total_amount=0)
+             for user_id in user_ids
+             for ingredient_id, delta in deltas.items() if delta > 0],
+            ignore_conflicts=True,
+        )
+        for ingredient_id, delta in deltas.items():
+            self.filter(
+                user__in=user_ids, ingredient_id=ingredient_id).update(
+                total_amount=F('total_amount') + delta)
+        self.filter(user__in=user_ids, ingredient__in=deltas,
+                    total_amount__lte=0).delete()
+
+    def expected(self):
+        """Список покупок, рассчитанный по корзинам."""
+        return IngredientAmount.objects.filter(
+            recipe__recipe_carts__isnull=False).values(
+            'recipe__recipe_carts__user', 'ingredient').annotate(
+            total_amount=Sum('amount')).order_by()
+
+    def rebuild(self):
+        self.all().delete()
+        self.bulk_create(
+            self.model(user_id=item['recipe__recipe_carts__user'],
+                       ingredient_id=item['ingredient'],
+                       total_amount=item['total_amount'])
+            for item in self.expected()
+        )
+
+
+class ShoppingListItem(models.Model):
+    """Модель агрегированного списка покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Владелец списка покупок",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Ингредиент",
+    )
+    total_amount = models.IntegerField(verbose_name="Общее количество")
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Позиции списков покупок"
+        ordering = ["ingredient__name"]
+        unique_together = ("user", "ingredient")
+
+    def __str__(self):
+        return f"{self.ingredient} - {self.total_amount}, у {self.user}"
@@ -0,0 +1,205 @@
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Ingredient, IngredientAmount, Recipe
+
+WORD_RE = re.compile(r'\w+')
+
+# Окончания для упрощённого стемминга, длинные раньше коротких.
+RUSSIAN_ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ов', 'ев', 'ей',
+    'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ую', 'юю', 'ию', 'ия', 'ья', 'ье',
+    'ью', 'ми', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+
+# Веса совпадений по умолчанию как у ts_rank: A, B, C.
+SEARCH_WEIGHTS = {'name': 1.0, 'ingredients': 0.4, 'text': 0.2}
+
+SEARCH_VECTOR_SQL = (
+    "UPDATE {recipe} AS r SET search_vector = "
+    "setweight(to_tsvector(%(config)s::regconfig, r.name), 'A') || "
+    "setweight(to_tsvector(%(config)s::regconfig, coalesce(("
+    "SELECT string_agg(i.name, ' ') FROM {amount} a "
+    "JOIN {ingredient} i ON i.id = a.ingredient_id "
+    "WHERE a.recipe_id = r.id), '')), 'B') || "
+    "setweight(to_tsvector(%(config)s::regconfig, r.text), 'C') "
+    "WHERE r.id = ANY(%(ids)s)"
+)
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Хранит отсортированный по названию массив и ищет префикс бинарным
+    поиском, затем добирает совпадения по подстроке. Сбрасывается
+    сигналами при изменении ингредиентов и по истечении TTL, чтобы
+    другие процессы тоже увидели изменения.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._keys = None
+        self._entries = None
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+            self._entries = None
+
+    def _load(self):
+        with self._lock:
+            expired = time.monotonic() - self._built_at > self.ttl
+            if self._entries is None or expired:
+                entries = sorted(
+                    (name.lower(), pk, name, unit)
+                    for pk, name, unit in Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit')
+                )
+                self._keys = [entry[0] for entry in entries]
+                self._entries = entries
+                self._built_at = time.monotonic()
+            return self._keys, self._entries
+
+    def search(self, query, limit=None):
+        keys, entries = self._load()
+        query = query.lower()
+        start = bisect.bisect_left(keys, query)
+        end = bisect.bisect_left(keys, query + '\uffff', lo=start)
+        matches = entries[start:end]
+        if limit is None or len(matches) < limit:
+            matches += [
+                entry for entry in entries[:start] + entries[end:]
+                if query in entry[0]
+            ]
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for _, pk, name, unit in matches[:limit]
+        ]
+
+
+def search_ingredients_db(query, limit=None):
+    """Поиск на стороне БД, на PostgreSQL использует триграммный индекс."""
+    queryset = Ingredient.objects.filter(name__icontains=query).annotate(
+        rank=Case(
+            When(name__istartswith=query, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('rank', 'name')
+    return queryset[:limit]
+
+
+def stem(word):
+    word = word.replace('ё', 'е')
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall(text.lower())]
+
+
+class RecipeSearchIndex:
+    """Обратный индекс рецептов в памяти процесса.
+
+    Запасной вариант полнотекстового поиска для SQLite и разработки:
+    основа слова -> {id рецепта: вес}. Как и индекс ингредиентов,
+    сбрасывается сигналами и по TTL.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._postings = None
+        self._built_at = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._postings = None
+
+    def _add(self, postings, recipe_id, text, weight):
+        for token in tokenize(text):
+            postings[token][recipe_id] = (
+                postings[token].get(recipe_id, 0) + weight)
+
+    def _load(self):
+        with self._lock:
+            expired = time.monotonic() - self._built_at > self.ttl
+            if self._postings is None or expired:
+                postings = defaultdict(dict)
+                recipes = Recipe.objects.values_list('id', 'name', 'text')
+                for pk, name, text in recipes.iterator():
+                    self._add(postings, pk, name, SEARCH_WEIGHTS['name'])
+                    self._add(postings, pk, text, SEARCH_WEIGHTS['text'])
+                amounts = IngredientAmount.objects.values_list(
+                    'recipe_id', 'ingredient__name')
+                for pk, name in amounts.iterator():
+                    self._add(
+                        postings, pk, name, SEARCH_WEIGHTS['ingredients'])
+                self._postings = dict(postings)
+                self._built_at = time.monotonic()
+            return self._postings
+
+    def search(self, query):
+        """id рецептов, содержащих все слова запроса, по убыванию веса."""
+        postings = self._load()
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        matches = sorted(
+            (postings.get(token, {}) for token in tokens), key=len)
+        ids = set(matches[0]).intersection(*matches[1:])
+        return sorted(
+            ids, key=lambda pk: (-sum(m[pk] for m in matches), -pk))
+
+
+def search_recipes(queryset, query):
+    """Полнотекстовый поиск по названию, ингредиентам и описанию."""
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(query, config=settings.RECIPE_SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    ids = recipe_index.search(query)
+    if not ids:
+        return queryset.none()
+    rank = Case(
+        *[When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).order_by(rank)
+
+
+def update_search_vectors(recipe_ids):
+    """Пересчитывает поисковые векторы рецептов после изменений."""
+    if connection.vendor != 'postgresql':
+        recipe_index.invalidate()
+        return
+    sql = SEARCH_VECTOR_SQL.format(
+        recipe=Recipe._meta.db_table,
+        amount=IngredientAmount._meta.db_table,
+        ingredient=Ingredient._meta.db_table,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'config': settings.RECIPE_SEARCH_CONFIG,
+            'ids': list(recipe_ids),
+        })
+
+
+ingredient_index = IngredientIndex(ttl=settings.INGREDIENT_INDEX_TTL)
+recipe_index = RecipeSearchIndex(ttl=settings.RECIPE_INDEX_TTL)
@@ -0,0 +1,133 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .counters import change_counter, change_counters
+from .feed import drop_followers_feeds, push_recipe
+from .images import schedule_renditions
+from .managers import relations_added, relations_removed
+from .matching import cookable_index
+from .models import Cart, Favorite, Ingredient, Recipe, ShoppingListItem
+from .search import ingredient_index, update_search_vectors
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Cart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipe(
+            instance.recipe_id, users=[instance.user_id])
+
+
+@receiver(pre_delete, sender=Cart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    # pre_delete нужен для каскадного удаления рецепта: его ингредиенты
+    # ещё в базе. Саму строку Cart получатель не читает, поэтому его можно
+    # вызывать и после DELETE в RelationManager.remove_relation.
+    ShoppingListItem.objects.remove_recipe(
+        instance.recipe_id, users=[instance.user_id])
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_delete, sender=Ingredient)
+def invalidate_cookable_index(sender, **kwargs):
+    cookable_index.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        ids = list(instance.ingredientamount.values_list(
+            'recipe_id', flat=True))
+        transaction.on_commit(lambda: update_search_vectors(ids))
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Cart)
+def increment_carts_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'carts_count', 1)
+
+
+@receiver(post_delete, sender=Cart)
+def decrement_carts_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'carts_count', -1)
+
+
+@receiver(relations_added, sender=Favorite)
+def increment_favorites_counts(sender, target_ids, **kwargs):
+    change_counters(Recipe, target_ids, 'favorites_count', 1)
+
+
+@receiver(relations_removed, sender=Favorite)
+def decrement_favorites_counts(sender, target_ids, **kwargs):
+    change_counters(Recipe, target_ids, 'favorites_count', -1)
+
+
+@receiver(relations_added, sender=Cart)
+def add_recipes_to_cart(sender, user_id, target_ids, **kwargs):
+    change_counters(Recipe, target_ids, 'carts_count', 1)
+    ShoppingListItem.objects.add_recipes(target_ids, users=[user_id])
+
+
+@receiver(relations_removed, sender=Cart)
+def remove_recipes_from_cart(sender, user_id, target_ids, **kwargs):
+    change_counters(Recipe, target_ids, 'carts_count', -1)
+    ShoppingListItem.objects.remove_recipes(target_ids, users=[user_id])
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_renditions(sender, instance, **kwargs):
+    if instance.image:
+        name = instance.image.name
+        transaction.on_commit(lambda: schedule_renditions(name))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            lambda: push_recipe(instance.id, instance.author_id))
+
+
+@receiver(post_delete, sender=Recipe)
+def drop_recipe_from_feeds(sender, instance, **kwargs):
+    drop_followers_feeds(instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def reindex_recipe(sender, instance, **kwargs):
+    # Ингредиенты пишутся после сохранения рецепта, поэтому индексы
+    # пересчитываются после коммита транзакции.
+    pk = instance.pk
+    transaction.on_commit(lambda: update_search_vectors([pk]))
+    transaction.on_commit(lambda: cookable_index.update([pk]))
@@ -10,7 +10,8 @@ User = get_user_model()
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     list_display = ('id', 'username', 'email', 'first_name',
-                    'last_name', 'password')
+                    'last_name', 'password', 'recipes_count',
+                    'subscribers_count')
     search_fields = ('username', 'email')
     list_filter = ('username', 'email')
     empty_value_display = '-пусто-'
@@ -0,0 +1,95 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+class LocalTokenCache:
+    """Ограниченный LRU-кэш токенов в памяти процесса с TTL."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return copy.copy(user)
+
+    def set(self, key, user):
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class SharedTokenCache:
+    """Кэш токенов в общем кэше Django, виден всем процессам."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    @staticmethod
+    def cache_key(key):
+        return f'auth-token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+    def get(self, key):
+        return cache.get(self.cache_key(key))
+
+    def set(self, key, user):
+        cache.set(self.cache_key(key), user, self.ttl)
+
+    def delete(self, key):
+        cache.delete(self.cache_key(key))
+
+
+def get_token_cache():
+    """Общий кэш, если он настроен, иначе LRU в памяти процесса.
+
+    Сброс локального кэша виден только своему процессу, поэтому
+    остальные процессы забывают токен не позже чем через TTL.
+    """
+    if settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS:
+        return LocalTokenCache(
+            settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+    return SharedTokenCache(settings.TOKEN_CACHE_TTL)
+
+
+token_cache = get_token_cache()
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе на каждый запрос."""
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is not None:
+            return user, Token(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user)
+        return user, token
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:16
+
+from django.db import migrations, models
+import django.db.models.expressions
+from django.db.models import Count, F, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    Subscription = apps.get_model('users', 'Subscription')
+    keep = Subscription.objects.values('user', 'author').annotate(
+        first=Min('id')).order_by().values_list('first', flat=True)
+    deleted, _ = Subscription.objects.filter(
+        user=F('author')).delete()
+    duplicates, _ = Subscription.objects.exclude(
+        id__in=list(keep)).delete()
+    if not deleted and not duplicates:
+        return
+    User = apps.get_model('users', 'User')
+    User.objects.update(subscribers_count=Coalesce(Subquery(
+        Subscription.objects.filter(author=OuterRef('pk')).order_by()
+        .values('author').annotate(total=Count('pk')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_subscription'),
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.CheckConstraint(check=models.Q(_negated=True, user=django.db.models.expressions.F('author')), name='prevent_self_subscription'),
+        ),
+    ]
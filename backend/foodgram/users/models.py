@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from recipes.managers import RelationManager
 from rest_framework.exceptions import ValidationError
 
 
@@ -26,6 +27,10 @@ class User(AbstractUser):
         max_length=150,
         verbose_name="Фамилия",
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Рецептов")
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Подписчиков")
 
     class Meta:
         verbose_name = "Пользователь"
@@ -53,10 +58,19 @@ class Subscription(models.Model):
         verbose_name="Подписчик",
     )
 
+    objects = RelationManager("author")
+
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
         ordering = ["-author"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "author"], name="unique_subscription"),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F("author")),
+                name="prevent_self_subscription"),
+        ]
 
     def __str__(self):
         """Строковое представление модели."""
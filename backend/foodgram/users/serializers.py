@@ -59,18 +59,23 @@ class SubscriptionSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes_count', 'recipes')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request_user = self.context.get('request').user.id
         return obj.subscribers.filter(user=request_user).exists()
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        recipes = obj.recipes.all()
-        limit = request.GET.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
+        if 'recipes_by_author' in self.context:
+            recipes = self.context['recipes_by_author'][obj.id]
+        else:
+            recipes = obj.recipes.all()
+            limit = request.GET.get('recipes_limit')
+            if limit:
+                recipes = recipes[:int(limit)]
         serializer = RecipeSubscSerializer(
             recipes, many=True, context={'request': request})
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
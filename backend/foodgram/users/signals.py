@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.counters import change_counter, change_counters
+from recipes.feed import drop_feeds
+from recipes.managers import relations_added, relations_removed
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .models import Subscription, User
+
+
+@receiver(post_save, sender=Subscription)
+def increment_subscribers_count(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, 'subscribers_count', 1)
+        drop_feeds([instance.user_id])
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_subscribers_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'subscribers_count', -1)
+    drop_feeds([instance.user_id])
+
+
+@receiver(relations_added, sender=Subscription)
+def increment_subscribers_counts(sender, user_id, target_ids, **kwargs):
+    change_counters(User, target_ids, 'subscribers_count', 1)
+    drop_feeds([user_id])
+
+
+@receiver(relations_removed, sender=Subscription)
+def decrement_subscribers_counts(sender, user_id, target_ids, **kwargs):
+    change_counters(User, target_ids, 'subscribers_count', -1)
+    drop_feeds([user_id])
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    key = instance.key
+    token_cache.delete(key)
+    transaction.on_commit(lambda: token_cache.delete(key))
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, update_fields=None,
+                       **kwargs):
+    # Смена пароля, деактивация и правка профиля должны сразу
+    # отразиться на аутентификации; вход обновляет только last_login.
+    if created or update_fields and set(update_fields) == {'last_login'}:
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True))
+    for key in keys:
+        token_cache.delete(key)
+    transaction.on_commit(lambda: [token_cache.delete(key) for key in keys])
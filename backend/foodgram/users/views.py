@@ -1,7 +1,14 @@
+from collections import defaultdict
+
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, F, OuterRef, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from recipes.models import Recipe
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from users.serializers import (ChangePasswordSerializer,
@@ -18,6 +25,7 @@ class CustomUserViewSet(viewsets.ModelViewSet):
     permission_classes = (AllowAny,)
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
+    lookup_value_regex = r'\d+'
 
     def get_serializer_class(self):
         print(self.action)
@@ -47,23 +55,64 @@ class CustomUserViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, permission_classes=[IsAuthenticated])
-    def subscriptions(self, request, context={}, *args, **kwargs):
-        context['request'] = self.request
-        queryset = User.objects.filter(subscribers__user=request.user)
+    def subscriptions(self, request, *args, **kwargs):
+        queryset = User.objects.filter(
+            subscribers__user=request.user).annotate(
+            is_subscribed=Exists(Subscription.objects.filter(
+                author=OuterRef('pk'), user=request.user)),
+        )
         page = self.paginate_queryset(queryset)
+        context = {
+            'request': request,
+            'recipes_by_author': self.get_authors_recipes(
+                page, request.query_params.get('recipes_limit')),
+        }
         serializer = SubscriptionSerializer(page, context=context, many=True)
         return self.get_paginated_response(serializer.data)
 
+    @staticmethod
+    def get_authors_recipes(authors, limit=None):
+        """Последние рецепты всех авторов страницы одним запросом."""
+        recipes = Recipe.objects.filter(author__in=authors).only(
+            'id', 'author_id', 'name', 'cooking_time', 'image', 'pub_date')
+        if limit:
+            recipes = recipes.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=F('pub_date').desc(),
+            ))
+            sql, params = recipes.query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) ranked '
+                'WHERE ranked.row_number <= %s '
+                'ORDER BY ranked.pub_date DESC',
+                params + (int(limit),),
+            )
+        recipes_by_author = defaultdict(list)
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        return recipes_by_author
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
-    def subscribe(self, request, context={}, *args, **kwargs):
-        context['request'] = self.request
-        author = get_object_or_404(User, id=kwargs['pk'])
+    def subscribe(self, request, *args, **kwargs):
         user = request.user
         if request.method == 'POST':
-            Subscription.objects.create(author=author, user=user)
-            serializer = CustomUserSerializer(author, context=context)
+            author = get_object_or_404(User, id=kwargs['pk'])
+            if author == user:
+                raise ValidationError(
+                    'Ошибка, нельзя подписываться на самого себя')
+            subscription = Subscription.objects.add_relation(
+                user.id, author.id)
+            if subscription is None:
+                raise ValidationError(
+                    'Ошибка, данная подписка уже существует')
+            author.request_user_subscriptions = [subscription]
+            serializer = CustomUserSerializer(
+                author, context={'request': request})
             return Response(serializer.data, status.HTTP_201_CREATED)
 
-        get_object_or_404(Subscription, author=author, user=user).delete()
+        removed = Subscription.objects.remove_relation(user.id, kwargs['pk'])
+        if removed is None:
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)